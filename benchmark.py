@@ -0,0 +1,331 @@
+# Author: Philip Beck
+# Email: stoneroll6@gmail.com
+# Date: 1/17/2021
+# Description:
+#    Reproducible benchmark suite for DirectedGraph
+#    and UndirectedGraph public methods
+#    For educational use only,
+#    Not for commercial use
+#
+# Usage:
+#    python benchmark.py --sizes 500,2000 --output results.json
+#    python benchmark.py --output new.json --compare results.json
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from d_graph import DirectedGraph
+from ud_graph import UndirectedGraph
+
+
+# Synthetic graph generators, each returns list of (u, v) index pairs
+
+def random_sparse(n: int, rng) -> list:
+    """
+    About 4 random edges per vertex
+    """
+    return [(rng.randrange(n), rng.randrange(n)) for _ in range(4 * n)]
+
+
+def random_dense(n: int, rng) -> list:
+    """
+    Each ordered pair is an edge with probability 0.2
+    """
+    return [(u, v) for u in range(n) for v in range(n)
+            if u != v and rng.random() < 0.2]
+
+
+def scale_free(n: int, rng) -> list:
+    """
+    Barabasi-Albert preferential attachment, 3 edges per new vertex
+    """
+    edges = []
+    targets = [0, 1, 2]
+    for v in range(3, n):
+        for u in set(rng.choice(targets) for _ in range(3)):
+            edges.append((v, u))
+            targets.append(u)
+        targets.extend([v] * 3)
+    return edges
+
+
+def grid(n: int, rng) -> list:
+    """
+    Square lattice with about n vertices
+    """
+    side = max(int(n ** 0.5), 1)
+    edges = []
+    for r in range(side):
+        for c in range(side):
+            v = r * side + c
+            if c + 1 < side:
+                edges.append((v, v + 1))
+            if r + 1 < side:
+                edges.append((v, v + side))
+    return edges
+
+
+def chain(n: int, rng) -> list:
+    """
+    Single long path, worst case for traversal depth
+    """
+    return [(v, v + 1) for v in range(n - 1)]
+
+
+GENERATORS = {
+    'sparse': random_sparse,
+    'dense': random_dense,
+    'scale_free': scale_free,
+    'grid': grid,
+    'chain': chain,
+}
+
+
+def directed_edges(pairs: list, rng) -> list:
+    """
+    Attach random positive weights to index pairs
+    """
+    return [(u, v, rng.randint(1, 100)) for u, v in pairs if u != v]
+
+
+def undirected_edges(pairs: list) -> list:
+    """
+    Convert index pairs to string vertex names
+    """
+    return [(f'v{u}', f'v{v}') for u, v in pairs if u != v]
+
+
+def summarize(latencies: list) -> dict:
+    """
+    Return throughput and latency percentiles for list of seconds
+    """
+    ordered = sorted(latencies)
+    total = sum(ordered)
+
+    def percentile(p):
+        return ordered[min(int(p / 100 * len(ordered)), len(ordered) - 1)]
+
+    return {
+        'calls': len(ordered),
+        'total_s': total,
+        'throughput_per_s': len(ordered) / total if total > 0 else None,
+        'mean_s': statistics.fmean(ordered),
+        'p50_s': percentile(50),
+        'p90_s': percentile(90),
+        'p99_s': percentile(99),
+    }
+
+
+def time_calls(fn, args_list: list) -> list:
+    """
+    Return latency in seconds of fn(*args) for each args tuple
+    """
+    latencies = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def peak_memory(fn, *args) -> int:
+    """
+    Return peak bytes allocated while running fn(*args)
+    """
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def directed_cases(edges: list, n: int, storage: str, rng, samples: int,
+                   cache: bool):
+    """
+    Yield (method, fn, args_list) for DirectedGraph
+    """
+    def build():
+        graph = DirectedGraph(edges, storage=storage)
+        # Repeated queries would otherwise time cache hits
+        if not cache:
+            graph.cache_size = 0
+        return graph
+
+    # Peak memory of build is the memory footprint of the graph
+    yield 'build', build, [()]
+    g = build()
+    sources = [(rng.randrange(g.v_count),) for _ in range(samples)]
+
+    # CSR graphs are read-only, only queries are timed
+    if storage != 'csr':
+        empty = DirectedGraph(storage=storage)
+        yield 'add_vertex', empty.add_vertex, [()] * min(n, 2000)
+
+        bare = DirectedGraph(storage=storage)
+        for _ in range(g.v_count):
+            bare.add_vertex()
+        yield 'add_edge', bare.add_edge, edges
+
+        # Each vertex is removed once, repeats would time no-ops
+        victim = build()
+        doomed = rng.sample(range(g.v_count), min(samples, g.v_count))
+        yield 'remove_vertex', victim.remove_vertex, [(v,) for v in doomed]
+
+    yield 'get_edges', g.get_edges, [()] * 3
+    yield 'dfs', g.dfs, sources
+    yield 'bfs', g.bfs, sources
+    yield 'has_cycle', g.has_cycle, [()] * 3
+    yield 'dijkstra', g.dijkstra, sources
+
+
+def undirected_cases(edges: list, n: int, rng, samples: int, cache: bool):
+    """
+    Yield (method, fn, args_list) for UndirectedGraph
+    """
+    def build():
+        graph = UndirectedGraph(edges)
+        if not cache:
+            graph.cache_size = 0
+        return graph
+
+    yield 'build', build, [()]
+    g = build()
+    vertices = g.get_vertices()
+    starts = [(rng.choice(vertices),) for _ in range(samples)]
+
+    empty = UndirectedGraph()
+    yield 'add_vertex', empty.add_vertex, [(f'v{i}',) for i in range(n)]
+
+    bare = UndirectedGraph()
+    yield 'add_edge', bare.add_edge, edges
+
+    # Each vertex is removed once, repeats would time no-ops
+    victim = build()
+    doomed = rng.sample(vertices, min(samples, len(vertices)))
+    yield 'remove_vertex', victim.remove_vertex, [(v,) for v in doomed]
+
+    yield 'get_edges', g.get_edges, [()] * 3
+    yield 'dfs', g.dfs, starts
+    yield 'bfs', g.bfs, starts
+    yield 'has_cycle', g.has_cycle, [()] * 3
+
+    # Mutate between queries so each call sees a changed graph
+    def mutate_and_count(u, v):
+        g.remove_edge(u, v)
+        g.add_edge(u, v)
+        return g.count_connected_components()
+    pairs = [edges[rng.randrange(len(edges))] for _ in range(samples)]
+    yield 'count_connected_components', mutate_and_count, pairs
+
+
+def run(kinds: list, sizes: list, storages: list, seed: int,
+        samples: int, memory: bool, cache=False) -> list:
+    """
+    Run all benchmark cases, return list of result records
+    """
+    results = []
+    for kind in kinds:
+        for n in sizes:
+            rng = random.Random(seed)
+            pairs = GENERATORS[kind](n, rng)
+            if not pairs:
+                continue
+            weighted = directed_edges(pairs, rng)
+            graphs = [(f'DirectedGraph[{storage}]', directed_cases(
+                weighted, n, storage, rng, samples, cache))
+                for storage in storages]
+            graphs.append(('UndirectedGraph', undirected_cases(
+                undirected_edges(pairs), n, rng, samples, cache)))
+
+            for graph_name, cases in graphs:
+                for method, fn, args_list in cases:
+                    record = {
+                        'graph': graph_name,
+                        'kind': kind,
+                        'n': n,
+                        'edges': len(pairs),
+                        'method': method,
+                    }
+                    record.update(summarize(time_calls(fn, args_list)))
+                    # Read-only calls can be repeated for memory; mutations
+                    # already ran, so their peak is not measured
+                    if memory and method not in (
+                            'add_vertex', 'add_edge', 'remove_vertex'):
+                        record['peak_bytes'] = peak_memory(fn, *args_list[0])
+                    results.append(record)
+                    print(f"{graph_name:26} {kind:10} n={n:<6} "
+                          f"{method:27} p50={record['p50_s'] * 1e3:9.3f}ms "
+                          f"p99={record['p99_s'] * 1e3:9.3f}ms",
+                          file=sys.stderr)
+    return results
+
+
+def compare(results: list, baseline: list) -> None:
+    """
+    Print p50 latency ratio of results against baseline run
+    """
+    def key(record):
+        return record['graph'], record['kind'], record['n'], record['method']
+
+    old = {key(record): record for record in baseline}
+    print(f"{'graph':26} {'kind':10} {'n':>6} {'method':27} {'p50 ratio':>9}")
+    for record in results:
+        before = old.get(key(record))
+        if before is None or before['p50_s'] == 0:
+            continue
+        ratio = record['p50_s'] / before['p50_s']
+        flag = '  <-- slower' if ratio > 1.1 else ''
+        print(f"{record['graph']:26} {record['kind']:10} {record['n']:>6} "
+              f"{record['method']:27} {ratio:9.2f}{flag}")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        description='Benchmark DirectedGraph and UndirectedGraph methods')
+    parser.add_argument('--kinds', default=','.join(GENERATORS),
+                        help='comma-separated graph generators')
+    parser.add_argument('--sizes', default='500,2000',
+                        help='comma-separated vertex counts')
+    parser.add_argument('--storage', default='dense,sparse',
+                        help='comma-separated DirectedGraph storage modes')
+    parser.add_argument('--samples', type=int, default=20,
+                        help='calls per traversal/shortest-path method')
+    parser.add_argument('--seed', type=int, default=2021)
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip tracemalloc peak memory measurement')
+    parser.add_argument('--cache', action='store_true',
+                        help='keep query result caching on, repeated '
+                             'queries then measure cache hits')
+    parser.add_argument('--output', help='write JSON results to file')
+    parser.add_argument('--compare', help='JSON results of earlier run')
+    args = parser.parse_args(argv)
+
+    results = run(args.kinds.split(','),
+                  [int(n) for n in args.sizes.split(',')],
+                  args.storage.split(','), args.seed, args.samples,
+                  not args.no_memory, args.cache)
+    report = {
+        'python': sys.version,
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'seed': args.seed,
+        'cache': args.cache,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f)['results'])
+
+
+if __name__ == '__main__':
+    main()
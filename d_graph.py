@@ -7,6 +7,26 @@
 #    For educational use only,
 #    Not for commercial use
 
+import heapq
+import operator
+from array import array
+from bisect import bisect_left
+from collections import deque
+
+from graph_async import (YIELD_EVERY, collect, drain, on_snapshot,
+                         run_steps)
+from graph_cache import ResultCache, cached
+from graph_stats import GraphStats, instrumented
+from graph_sync import NO_LOCK, make_lock, synchronized
+from graph_traversal import (bfs_order, dfs_order, iter_bfs, iter_dfs,
+                             join_paths)
+
+# NumPy is optional, only needed for 'numpy' storage and matrix algorithms
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 class DirectedGraph:
     """
@@ -17,23 +37,221 @@ class DirectedGraph:
     - Vertex names are integers
     """
 
-    def __init__(self, start_edges=None):
+    STORAGE_MODES = ('dense', 'sparse', 'csr', 'numpy')
+    # Reachability bitsets take components^2 bits, larger graphs get
+    # interval labels over the component DAG instead
+    REACH_BITSET_LIMIT = 8192
+    # DFS orders labeled above the bitset limit, each one rules out more
+    # unreachable pairs without a search
+    REACH_LABELINGS = 2
+    # In-place bitset updates before the index is rebuilt on demand
+    REACH_UPDATE_LIMIT = 64
+    # Items in cached query results per graph, 0 disables caching
+    cache_size = 1 << 16
+
+    def __init__(self, start_edges=None, storage='dense'):
         """
-        Store graph info as adjacency matrix
+        Store graph info as adjacency matrix (dense), as
+        list of {dst: weight} dictionaries per vertex (sparse),
+        as read-only offsets/targets/weights arrays (csr)
+        or as adjacency matrix in a NumPy int64 array (numpy), float64
+        once any weight is not an int
         """
+        if storage not in self.STORAGE_MODES:
+            raise ValueError(f'Unknown storage mode: {storage!r}')
+        if storage == 'numpy':
+            _require_numpy()
+        self.storage = storage
+        # GraphStats while instrumentation is enabled, None otherwise
+        self.stats = None
         self.v_count = 0
         self.adj_matrix = []
+        self.adj_list = []
+        self.adj_csr = (array('q', [0]), array('i'), array('q'))
+        if storage == 'numpy':
+            # adj_matrix is a view of a larger zeroed buffer so that
+            # add_vertex() only reallocates when capacity doubles
+            self._np_buffer = np.zeros((0, 0), dtype=np.int64)
+            self.adj_matrix = self._np_buffer
+        # Sorted neighbor lists of sparse rows, dropped when row changes
+        self._sorted_adj = dict()
+        # Tombstones of removed vertices, reclaimed by compact()
+        self._removed = set()
+        # Topological order, position of each vertex in it and sets of
+        # predecessors, kept up to date by mutations once computed,
+        # None if unknown or graph has a cycle
+        self._topo = None
+        self._topo_pos = None
+        self._topo_preds = None
+        # Reachability index: component of each vertex and bitset of
+        # components reachable from each component, None until queried
+        # With too many components _reach is the component DAG as
+        # (offsets, targets) and _reach_labels its interval labels
+        self._reach = None
+        self._reach_comp = None
+        self._reach_labels = None
+        self._reach_updates = 0
+        # Incoming edges of sparse/csr graphs, built for one graph version
+        self._reverse = None
+        self._reverse_version = None
+        # Bumped by every mutation, cached results of older versions are stale
+        self._version = 0
+        self._cache = ResultCache()
+        self._cache_version = 0
+        # Held by mutations and snapshot(), readers never take it,
+        # no-op until enable_concurrency() is called
+        self._lock = NO_LOCK
+        # (version, read-only copy) returned by snapshot()
+        self._snapshot = None
+        # ChangeLog recording mutations (see graph_log), None if not logged
+        self._log = None
 
         # Populate graph with initial vertices and edges (if provided)
-        # Before using, implement add_vertex() and add_edge() methods
         if start_edges is not None:
-            v_count = 0
-            for u, v, _ in start_edges:
-                v_count = max(v_count, u, v)
-            for _ in range(v_count + 1):
-                self.add_vertex()
-            for u, v, weight in start_edges:
-                self.add_edge(u, v, weight)
+            self._load_edges(start_edges)
+
+    @classmethod
+    def from_edge_array(cls, edges, storage='dense'):
+        """
+        Builds graph in one pass from array of (src, dst, weight) rows,
+        such as a NumPy array or list of tuples
+        Invalid rows are skipped, duplicate edges keep the last weight
+        """
+        graph = cls(storage=storage)
+        graph._load_edges(edges)
+        return graph
+
+    @classmethod
+    def from_csr(cls, offsets, targets, weights, removed=()):
+        """
+        Wraps CSR arrays as read-only graph without copying them,
+        edges of vertex v are targets/weights[offsets[v]:offsets[v+1]]
+        sorted by target, any array or memoryview of ints can be used
+        Vertices in removed are tombstones, as left by remove_vertex()
+        """
+        graph = cls(storage='csr')
+        graph.adj_csr = (offsets, targets, weights)
+        graph.v_count = len(offsets) - 1
+        graph._removed = set(removed)
+        return graph
+
+    def __getstate__(self) -> dict:
+        """
+        Returns state for pickle and copy, leaving out the lock, cache,
+        snapshot and change log, which belong to this object only
+        """
+        state = self.__dict__.copy()
+        for name in ('_cache', '_snapshot', '_log'):
+            del state[name]
+        # Only whether concurrency is on is kept
+        state['_lock'] = self._lock is not NO_LOCK
+        # NumPy matrix is a view of the buffer, rebuilt on restore
+        if self.storage == 'numpy':
+            del state['adj_matrix']
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        """
+        Restores state from __getstate__() with a new lock, an empty
+        cache, no snapshot and no change log
+        """
+        self.__dict__.update(state)
+        if self.storage == 'numpy':
+            self.adj_matrix = self._np_buffer[:self.v_count, :self.v_count]
+        self._lock = make_lock(state['_lock'])
+        self._cache = ResultCache()
+        self._snapshot = None
+        self._log = None
+
+    def snapshot(self):
+        """
+        Returns read-only CSR copy of the graph that is safe to query
+        from any number of threads while this graph keeps changing
+        Copy is shared until the next mutation
+        """
+        if self.storage == 'csr':
+            return self
+        with self._lock:
+            return drain(self._snapshot_steps())
+
+    def _snapshot_steps(self):
+        """
+        Step generator behind snapshot(), yields once per row copied
+        Rows are read one at a time under the lock, so mutations can run
+        in between; the copy then starts over once, the second time
+        without yielding
+        """
+        if self.storage == 'csr':
+            return self
+        for _ in range(2):
+            version = self._version
+            if self._snapshot is not None and self._snapshot[0] == version:
+                return self._snapshot[1]
+            csr = yield from _pack_steps(self._rows_at(version))
+            with self._lock:
+                if self._version == version:
+                    graph = DirectedGraph.from_csr(*csr, self._removed)
+                    self._snapshot = (version, graph)
+                    return graph
+        return self.snapshot()
+
+    def _rows_at(self, version: int):
+        """
+        Yields _neighbors() of every vertex, each read under the lock,
+        stops early once the graph has changed since version
+        """
+        for v in range(self.v_count):
+            with self._lock:
+                if self._version != version:
+                    return
+                row = self._neighbors(v)
+            yield row
+
+    @instrumented
+    def to_csr(self) -> tuple:
+        """
+        Returns (offsets, targets, weights) arrays describing the graph
+        """
+        return pack_csr(self._neighbors(v) for v in range(self.v_count))
+
+    def _load_edges(self, edges) -> None:
+        """
+        Allocates all vertices at once, then fills in edges
+        """
+        # NumPy arrays convert to nested lists far faster than row iteration
+        if hasattr(edges, 'tolist'):
+            edges = edges.tolist()
+        edges = [(int(u), int(v), w) for u, v, w in edges]
+
+        v_count = max((max(u, v) for u, v, _ in edges), default=0)
+        v_count = max(v_count, 0) + 1
+        if self.storage == 'dense':
+            rows = [[0] * v_count for _ in range(v_count)]
+        elif self.storage == 'numpy':
+            rows = np.zeros((v_count, v_count), dtype=np.int64
+                            if _all_ints(w for _, _, w in edges)
+                            else np.float64)
+        else:
+            rows = [dict() for _ in range(v_count)]
+        self.v_count = v_count
+        self._sorted_adj.clear()
+        self._topo = None
+        self._reach = None
+        self._version += 1
+
+        for u, v, weight in edges:
+            if weight < 1 or u == v or u < 0 or v < 0:
+                continue
+            rows[u][v] = weight
+
+        if self.storage == 'dense':
+            self.adj_matrix = rows
+        elif self.storage == 'numpy':
+            self._np_buffer = self.adj_matrix = rows
+        elif self.storage == 'sparse':
+            self.adj_list = rows
+        else:
+            self.adj_csr = pack_csr(sorted(row.items()) for row in rows)
 
     def __str__(self):
         """
@@ -45,208 +263,1405 @@ class DirectedGraph:
         out += ' '.join(['{:2}'.format(i) for i in range(self.v_count)]) + '\n'
         out += '-' * (self.v_count * 3 + 3) + '\n'
         for i in range(self.v_count):
-            row = self.adj_matrix[i]
+            row = self._row(i)
             out += '{:2} |'.format(i)
             out += ' '.join(['{:2}'.format(w) for w in row]) + '\n'
         out = f"GRAPH ({self.v_count} vertices):\n{out}"
         return out
 
+    @synchronized
     def add_vertex(self) -> int:
         """
         Adds vertex, returns # of vertices
         """
-        self.adj_matrix.append([0]) 
-        self.v_count += 1
-
-        # Update number of columns in each row
-        for _ in range(self.v_count - 1):
-            self.adj_matrix[self.v_count - 1].append(0)
-        for i in range(self.v_count - 1):
-            self.adj_matrix[i].append(0)
+        self._check_writable()
+        self._version += 1
+        if self._log is not None:
+            self._log.record(('add_vertex',))
+        # New vertex has no edges, so it can go last in the order
+        if self._topo is not None:
+            self._topo_pos.append(len(self._topo))
+            self._topo.append(self.v_count)
+            self._topo_preds.append(set())
+        # New vertex is a component of its own that reaches only itself,
+        # its index is larger than any component's
+        if self._reach is not None:
+            if self._reach_labels is not None:
+                offsets = self._reach[0]
+                self._reach_comp.append(len(offsets) - 1)
+                offsets.append(offsets[-1])
+                for low, rank, first in self._reach_labels:
+                    low.append(len(rank))
+                    rank.append(len(rank))
+                    first.append(len(first))
+            else:
+                self._reach_comp.append(len(self._reach))
+                self._reach.append(1 << len(self._reach))
+        self._grow(self.v_count + 1)
         return self.v_count
 
+    @synchronized
     def add_edge(self, src: int, dst: int, weight=1) -> None:
         """
         Adds/updates weighted edge between two vertices
         """
-        if src >= self.v_count or dst >= self.v_count \
-            or weight < 1 or src == dst or src < 0 or dst < 0:
+        self._check_writable()
+        if not self._has_vertex(src) or not self._has_vertex(dst) \
+            or weight < 1 or src == dst:
             return
-    
+        if self._topo is not None:
+            if self._topo_insert(src, dst):
+                self._topo_preds[dst].add(src)
+            else:
+                # Edge closes a cycle, no topological order exists anymore
+                self._topo = None
+        if self._reach is not None:
+            self._reach_insert(src, dst)
+        if self.storage == 'sparse':
+            if dst not in self.adj_list[src]:
+                self._sorted_adj.pop(src, None)
+            self.adj_list[src][dst] = weight
         else:
+            if self.storage == 'numpy':
+                self._np_fit((weight,))
             self.adj_matrix[src][dst] = weight
+        self._version += 1
+        if self._log is not None:
+            self._log.record(('add_edge', src, dst, weight))
 
+    @synchronized
     def remove_edge(self, src: int, dst: int) -> None:
         """
         Removes directed edge between two vertices
         """
+        self._check_writable()
         if src >= self.v_count or dst >= self.v_count \
             or src < 0 or dst < 0:
             return
-
+        # Removal can only shrink reachability, index is rebuilt on demand
+        if self._reach is not None and self._weight(src, dst) > 0:
+            self._reach = None
+        if self.storage == 'sparse':
+            if self.adj_list[src].pop(dst, None) is not None:
+                self._sorted_adj.pop(src, None)
         else:
             self.adj_matrix[src][dst] = 0
+        if self._topo is not None:
+            self._topo_preds[dst].discard(src)
+        self._version += 1
+        if self._log is not None:
+            self._log.record(('remove_edge', src, dst))
+
+    @synchronized
+    def remove_vertex(self, v: int) -> None:
+        """
+        Removes vertex and all its edges, its index stays reserved
+        (tombstone) until compact() renumbers the vertices
+        """
+        self._check_writable()
+        if not self._has_vertex(v):
+            return
+        # Vertex stays in topological order without edges
+        if self._topo is not None:
+            for i in self._adjacent(v):
+                self._topo_preds[i].discard(v)
+            self._topo_preds[v].clear()
+        self._reach = None
+        if self.storage == 'sparse':
+            self.adj_list[v].clear()
+            # No reverse index, so incoming edges need a scan of all rows
+            for i, row in enumerate(self.adj_list):
+                if row.pop(v, None) is not None:
+                    self._sorted_adj.pop(i, None)
+            self._sorted_adj.pop(v, None)
+        elif self.storage == 'numpy':
+            # Zeroes the shared buffer, rows stay clean for compact()
+            self.adj_matrix[v, :] = 0
+            self.adj_matrix[:, v] = 0
+        else:
+            self.adj_matrix[v] = [0] * self.v_count
+            for row in self.adj_matrix:
+                row[v] = 0
+        self._removed.add(v)
+        self._version += 1
+        if self._log is not None:
+            self._log.record(('remove_vertex', v))
 
+    @synchronized
+    def compact(self) -> dict:
+        """
+        Drops rows and columns of removed vertices and renumbers live
+        vertices in ascending order, returns {old index: new index}
+        """
+        self._check_writable()
+        live = [v for v in range(self.v_count) if v not in self._removed]
+        remap = {old: new for new, old in enumerate(live)}
+        if not self._removed:
+            return remap
+
+        if self.storage == 'sparse':
+            self.adj_list = [{remap[dst]: weight
+                              for dst, weight in self.adj_list[src].items()}
+                             for src in live]
+        elif self.storage == 'numpy':
+            index = np.array(live, dtype=np.intp)
+            self._np_buffer = self.adj_matrix = \
+                self.adj_matrix[np.ix_(index, index)]
+        else:
+            rows = [self.adj_matrix[src] for src in live]
+            self.adj_matrix = [[row[dst] for dst in live] for row in rows]
+        self.v_count = len(live)
+        self._removed.clear()
+        self._sorted_adj.clear()
+        self._reach = None
+        if self._topo is not None:
+            self._topo = [remap[v] for v in self._topo if v in remap]
+            self._topo_pos = [0] * self.v_count
+            for position, v in enumerate(self._topo):
+                self._topo_pos[v] = position
+            self._topo_preds = [{remap[u] for u in self._topo_preds[v]}
+                                for v in live]
+        self._version += 1
+        if self._log is not None:
+            self._log.record(('compact',))
+        return remap
+
+    @synchronized
+    def apply_edits(self, edits) -> None:
+        """
+        Applies many mutations in one pass, with the same result as
+        calling them in order; each edit is a tuple of method name and
+        arguments: ('add_vertex',), ('add_edge', src, dst[, weight]),
+        ('remove_edge', src, dst) or ('remove_vertex', v)
+        """
+        self._check_writable()
+        if self._log is not None:
+            edits = list(edits)
+        # Last edit per edge wins, 0 marks a removal
+        pending = dict()
+        # Edges removed before being set again, re-added at the end of row
+        reset = set()
+        removed = set()
+        v_count = self.v_count
+
+        for op, *args in edits:
+            if op == 'add_vertex':
+                v_count += 1
+            elif op == 'add_edge':
+                src, dst, weight = (*args, 1) if len(args) == 2 else args
+                if src == dst or weight < 1 \
+                        or not 0 <= src < v_count or not 0 <= dst < v_count \
+                        or src in removed or dst in removed \
+                        or src in self._removed or dst in self._removed:
+                    continue
+                # Edge set again after removal moves to the end of row
+                if pending.get((src, dst)) == 0:
+                    del pending[(src, dst)]
+                pending[(src, dst)] = weight
+            elif op == 'remove_edge':
+                src, dst = args
+                if 0 <= src < v_count and 0 <= dst < v_count:
+                    pending[(src, dst)] = 0
+                    reset.add((src, dst))
+            elif op == 'remove_vertex':
+                v, = args
+                if 0 <= v < v_count and v not in self._removed:
+                    removed.add(v)
+            else:
+                raise ValueError(f'Unknown edit: {op!r}')
+        if not pending and not removed and v_count == self.v_count:
+            return
+
+        self._grow(v_count)
+        # Edges of removed vertices are cleared below
+        pending = [(src, dst, weight)
+                   for (src, dst), weight in pending.items()
+                   if src not in removed and dst not in removed]
+        if self.storage == 'sparse':
+            for src, dst, weight in pending:
+                row = self.adj_list[src]
+                if (src, dst) in reset:
+                    row.pop(dst, None)
+                if weight:
+                    row[dst] = weight
+                self._sorted_adj.pop(src, None)
+            for v in removed:
+                self.adj_list[v].clear()
+                self._sorted_adj.pop(v, None)
+            # Single scan of all rows drops incoming edges of every
+            # removed vertex
+            if removed:
+                for i, row in enumerate(self.adj_list):
+                    if row and not removed.isdisjoint(row):
+                        for v in removed.intersection(row):
+                            del row[v]
+                        self._sorted_adj.pop(i, None)
+        elif self.storage == 'numpy':
+            if pending:
+                src, dst, weight = zip(*pending)
+                self._np_fit(weight)
+                self.adj_matrix[list(src), list(dst)] = weight
+            if removed:
+                index = list(removed)
+                self.adj_matrix[index, :] = 0
+                self.adj_matrix[:, index] = 0
+        else:
+            for src, dst, weight in pending:
+                self.adj_matrix[src][dst] = weight
+            for v in removed:
+                self.adj_matrix[v] = [0] * self.v_count
+            if removed:
+                for row in self.adj_matrix:
+                    for v in removed:
+                        row[v] = 0
+
+        # Indexes are rebuilt once on the next query
+        self._removed |= removed
+        self._topo = None
+        self._reach = None
+        self._version += 1
+        if self._log is not None:
+            for edit in edits:
+                self._log.record(edit)
+
+    @instrumented
     def get_vertices(self) -> list:
         """
         Returns a list of vertices
         """
         vertices = []
         for i in range(self.v_count):
-            vertices.append(i)
+            if i not in self._removed:
+                vertices.append(i)
         return vertices
 
+    @instrumented
+    @cached
     def get_edges(self) -> list:
         """
         Returns list of edges as tuples -> (src,dst,weight)
         """
-        edges = []
+        return list(self.iter_edges())
+
+    def iter_edges(self):
+        """
+        Yields edges as tuples -> (src,dst,weight) in get_edges() order
+        """
+        if self.storage == 'numpy':
+            # Row-major nonzero scan gives the same order as the loops below
+            srcs, dsts = np.nonzero(self.adj_matrix)
+            weights = self.adj_matrix[srcs, dsts]
+            yield from zip(srcs.tolist(), dsts.tolist(), weights.tolist())
+            return
         for i in range(self.v_count):
-            for j in range(self.v_count):
-                if self.adj_matrix[i][j] > 0:
-                    edges.append((i, j, self.adj_matrix[i][j]))
-        return edges
+            for j, weight in self._neighbors(i):
+                yield (i, j, weight)
 
+    @instrumented
     def is_valid_path(self, path: list) -> bool:
         """
         Determines if list of index vertices is valid path
         """
         if len(path) > 1:
             for i in range(len(path) - 1):
-                if self.adj_matrix[path[i]][path[i+1]] == 0:
+                if self._weight(path[i], path[i+1]) == 0:
                     return False
         return True
 
+    @instrumented
+    @cached
     def dfs(self, v_start, v_end=None) -> list:
         """
         Performs depth-first search and returns list
         of visited vertices in order of visit
         """
-        visited = []
-
         # Catch invalid indices
-        if v_start < 0 or v_start >= len(self.adj_matrix):
-            return visited
-        elif v_end is not None:
-            if v_end < 0 or v_end >= len(self.adj_matrix):
-                v_end = None
+        if not self._has_vertex(v_start):
+            return []
+        if v_end is not None and (v_end < 0 or v_end >= self.v_count):
+            v_end = None
 
-        # Stack goes as deep as possible, then back-tracks
-        else:
-            stack = [v_start]
-            while stack:
-                index = stack.pop()
-                if index not in visited:
-                    visited.append(index)
-                v = self.adj_matrix[index]
-                # Check vertices in ascending order
-                for i in range(len(v) - 1, -1, -1):
-                    if v[i] > 0 and i not in visited:
-                        stack.append(i)
-                    if i == v_end:
-                        visited.append(i)
-                        return visited
-            return visited            
+        # Check vertices in ascending order
+        return dfs_order(v_start, self._adjacent, v_end, self.stats)
 
+    @instrumented
+    @cached
     def bfs(self, v_start, v_end=None) -> list:
         """
         Performs breadth-first search and returns list
         of visited vertices in order of visit
         """
-        visited = []
-
         # Catch invalid indices
-        if v_start < 0 or v_start >= len(self.adj_matrix):
-            return visited
-        elif v_end is not None:
-            if v_end < 0 or v_end >= len(self.adj_matrix):
-                v_end = None
+        if not self._has_vertex(v_start):
+            return []
+        if v_end is not None and (v_end < 0 or v_end >= self.v_count):
+            v_end = None
 
-        else:
-            queue = [v_start]
-            while queue:
-                index = queue.pop(0)
-                if index not in visited:
-                    visited.append(index)
-                v = self.adj_matrix[index]
-                # Check vertices in ascending order
-                for i in range(self.v_count):
-                    if v[i] > 0 and i not in visited:
-                        queue.append(i)
-                    if i == v_end:
-                        visited.append(i)
-                        return visited
-            return visited
+        # Check vertices in ascending order
+        return bfs_order(v_start, self._adjacent, v_end, self.stats)
+
+    def iter_dfs(self, v_start, details=False):
+        """
+        Yields vertices in depth-first order as they are visited,
+        (vertex, depth, parent) tuples if details is True
+        """
+        if not self._has_vertex(v_start):
+            return iter(())
+        return iter_dfs(v_start, self._adjacent, details, self.stats)
+
+    def iter_bfs(self, v_start, details=False):
+        """
+        Yields vertices in breadth-first order as they are visited,
+        (vertex, depth, parent) tuples if details is True
+        """
+        if not self._has_vertex(v_start):
+            return iter(())
+        return iter_bfs(v_start, self._adjacent, details, self.stats)
 
+    @instrumented
+    @cached
     def has_cycle(self) -> bool:
         """
         Determines if graph has at least one cycle
         """
-        # Check multiple connected components
-        for i in range(self.v_count):
-            # Initialize visited list with root
-            visited = [i]
-            # Initialize stack with 2nd-degree neighbors
-            adjacent_list = []
-            for j in range(self.v_count):
-                if self.adj_matrix[i][j] > 0:
-                    adjacent_list.append(j)    
-            for adjacent in adjacent_list:
-                neighbor_list = []
-                for k in range(self.v_count):
-                    if self.adj_matrix[adjacent][k] > 0:
-                        neighbor_list.append(k)
-                result = self.has_cycle_helper(adjacent, visited, neighbor_list)
-                if result is True:
-                    return True
-        return False
+        # Known topological order proves graph is acyclic
+        if self._topo is not None:
+            return False
+        return self.find_cycle() != []
 
-    def has_cycle_helper(self, vertex, visited: list, stack: list) -> bool:
-        while stack != []:
-            v = stack.pop()
-            # Check 2nd-degree neighbors for any cycle
-            for i in visited:
-                if self.adj_matrix[v][i] > 0:
-                    return True
-            # Pass down new lists to next recursive level
-            else:
-                new_visited = visited.copy()
-                new_visited.append(vertex)
-                new_stack = []
-                for j in range(self.v_count):
-                    if self.adj_matrix[v][j] > 0:
-                        new_stack.append(j)
-                result = self.has_cycle_helper(v, new_visited, new_stack)
-                if result is True:
-                    return True
-        return False
+    @instrumented
+    @cached
+    def find_cycle(self) -> list:
+        """
+        Returns list of vertices forming a cycle in traversal order
+        (last vertex has edge back to first), empty list if acyclic
+        """
+        return drain(self._find_cycle_steps())
 
-    def dijkstra(self, src: int) -> list:
+    @instrumented
+    @cached
+    def dijkstra(self, src: int, target=None) -> list:
         """
         Uses Dijkstra's algorithm to compute length of shortest path
         to all other vertices from source input, unreachable vertices
         have value float('inf')
+        If target is provided, search stops once target is settled and
+        only the distance to target is guaranteed to be final
         """
-        # Tracks distance from source as indexed array
-        distances = [float('inf')] * self.v_count
-        distances[src] = 0
+        distances, _ = self.dijkstra_tree(src, target)
+        return distances
+
+    @instrumented
+    @cached
+    def dijkstra_tree(self, src: int, target=None) -> tuple:
+        """
+        Runs heap-based Dijkstra from source and returns tuple
+        (distances, predecessors), predecessor of source and
+        unreachable vertices is None
+        """
+        return drain(self._dijkstra_steps(src, target))
+
+    @instrumented
+    @cached
+    def shortest_path(self, src: int, dst: int) -> tuple:
+        """
+        Returns tuple (distance, path) for shortest path from src to dst,
+        unreachable or invalid vertices give (float('inf'), [])
+        """
+        distances, predecessors = self.dijkstra_tree(src, dst)
+        if dst < 0 or dst >= self.v_count or distances[dst] == float('inf'):
+            return float('inf'), []
+
+        return distances[dst], _walk_path(predecessors, src, dst)
+
+    @instrumented
+    @cached
+    def bidirectional_dijkstra(self, src: int, dst: int) -> tuple:
+        """
+        Returns tuple (distance, path) for shortest path from src to dst,
+        searching forward from src and backward from dst until the two
+        searches meet, unreachable or invalid vertices give (float('inf'), [])
+        """
+        if not self._has_vertex(src) or not self._has_vertex(dst):
+            return float('inf'), []
+        if src == dst:
+            return 0, [src]
+
+        # Index 0 is the forward search from src, 1 the backward from dst
+        stats = self.stats
+        distances = ({src: 0}, {dst: 0})
+        parents = ({src: None}, {dst: None})
+        settled = (set(), set())
+        heaps = ([(0, src)], [(0, dst)])
+        expand = (self._neighbors, self._in_neighbors)
+        best, meet = float('inf'), None
+        while heaps[0] and heaps[1]:
+            # No path through unsettled vertices can beat the best one
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            side = 0 if len(heaps[0]) <= len(heaps[1]) else 1
+            dist, v = heapq.heappop(heaps[side])
+            if v in settled[side]:
+                continue
+            settled[side].add(v)
+            if stats is not None:
+                stats.count('bidirectional_dijkstra.vertices_popped')
+            other = distances[1 - side]
+            for i, weight in expand[side](v):
+                if i in settled[side]:
+                    continue
+                if dist + weight < distances[side].get(i, float('inf')):
+                    distances[side][i] = dist + weight
+                    parents[side][i] = v
+                    heapq.heappush(heaps[side], (dist + weight, i))
+                if i in other and dist + weight + other[i] < best:
+                    best = dist + weight + other[i]
+                    meet = i
+        if meet is None:
+            return float('inf'), []
+        return best, join_paths(parents, meet)
+
+    @instrumented
+    @cached
+    def astar(self, src: int, dst: int, heuristic=None) -> tuple:
+        """
+        Returns tuple (distance, path) for shortest path from src to dst,
+        expanding vertices in order of distance + heuristic(v, dst), which
+        must never overestimate the remaining distance to dst
+        Without heuristic this is dijkstra stopping at dst
+        """
+        if not self._has_vertex(src) or not self._has_vertex(dst):
+            return float('inf'), []
+        if heuristic is None:
+            heuristic = _no_heuristic
+
+        # Heap holds (estimate, distance, vertex), outdated entries are
+        # skipped, vertices are reopened if a shorter distance turns up
+        stats = self.stats
+        distances = {src: 0}
+        parents = {src: None}
+        heap = [(heuristic(src, dst), 0, src)]
+        while heap:
+            _, dist, v = heapq.heappop(heap)
+            if dist > distances[v]:
+                continue
+            if stats is not None:
+                stats.count('astar.vertices_popped')
+            if v == dst:
+                return dist, join_paths((parents, {dst: None}), dst)
+            for i, weight in self._neighbors(v):
+                if dist + weight < distances.get(i, float('inf')):
+                    distances[i] = dist + weight
+                    parents[i] = v
+                    estimate = dist + weight + heuristic(i, dst)
+                    heapq.heappush(heap, (estimate, dist + weight, i))
+        return float('inf'), []
+
+    @instrumented
+    def strongly_connected_components(self) -> list:
+        """
+        Returns list of strongly connected components, each a sorted list
+        of vertices, found by iterative Tarjan in O(V + E)
+        Components are in topological order: no edge leads from a
+        component to an earlier one
+        """
+        index = [None] * self.v_count
+        low = [0] * self.v_count
+        on_stack = [False] * self.v_count
+        stack = []
+        components = []
+        counter = 0
+        stats = self.stats
+
+        for root in range(self.v_count):
+            if index[root] is not None or root in self._removed:
+                continue
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+            # Explicit call stack of (vertex, remaining neighbors)
+            work = [(root, iter(self._adjacent(root)))]
+            while work:
+                if stats is not None:
+                    stats.mark('scc.stack', len(work))
+                v, neighbors = work[-1]
+                for i in neighbors:
+                    if index[i] is None:
+                        index[i] = low[i] = counter
+                        counter += 1
+                        stack.append(i)
+                        on_stack[i] = True
+                        work.append((i, iter(self._adjacent(i))))
+                        break
+                    elif on_stack[i]:
+                        low[v] = min(low[v], index[i])
+                else:
+                    # All neighbors done, return to caller
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[v])
+                    # v is root of a component, pop its members
+                    if low[v] == index[v]:
+                        component = []
+                        while True:
+                            i = stack.pop()
+                            on_stack[i] = False
+                            component.append(i)
+                            if i == v:
+                                break
+                        component.sort()
+                        components.append(component)
+
+        # Tarjan finds components in reverse topological order
+        components.reverse()
+        return components
+
+    @instrumented
+    def condensation(self) -> tuple:
+        """
+        Returns tuple (graph, component) where graph is a DirectedGraph
+        with one vertex per strongly connected component, numbered as in
+        strongly_connected_components(), and component[v] is the vertex
+        v collapsed into (None for removed vertices)
+        Edges between two components keep their smallest weight
+        """
+        components = self.strongly_connected_components()
+        component = [None] * self.v_count
+        for c, members in enumerate(components):
+            for v in members:
+                component[v] = c
+
+        weights = dict()
+        for src, dst, weight in self.iter_edges():
+            edge = (component[src], component[dst])
+            if edge[0] != edge[1] and weight < weights.get(edge, float('inf')):
+                weights[edge] = weight
+
+        # Read-only CSR graphs condense into sparse storage
+        storage = 'sparse' if self.storage == 'csr' else self.storage
+        graph = DirectedGraph(storage=storage)
+        for _ in components:
+            graph.add_vertex()
+        for (src, dst), weight in weights.items():
+            graph.add_edge(src, dst, weight)
+        return graph, component
+
+    @instrumented
+    def reachable(self, u: int, v: int) -> bool:
+        """
+        Returns True if there is a path from u to v (every vertex reaches
+        itself), answered from reachability index built on first query
+        """
+        if not self._has_vertex(u) or not self._has_vertex(v):
+            return False
+        if self._reach is None:
+            self._reach_build()
+        if self._reach_labels is not None:
+            return self._reach_search(self._reach_comp[u], self._reach_comp[v])
+        return self._reach[self._reach_comp[u]] >> self._reach_comp[v] & 1 == 1
+
+    @instrumented
+    def reachable_pairs(self, pairs) -> list:
+        """
+        Returns list of reachable(u, v) results for iterable of (u, v) pairs
+        """
+        if self._reach is None:
+            self._reach_build()
+        reach, component = self._reach, self._reach_comp
+        has_vertex = self._has_vertex
+        if self._reach_labels is not None:
+            search = self._reach_search
+            return [has_vertex(u) and has_vertex(v)
+                    and search(component[u], component[v])
+                    for u, v in pairs]
+        return [has_vertex(u) and has_vertex(v)
+                and reach[component[u]] >> component[v] & 1 == 1
+                for u, v in pairs]
+
+    @instrumented
+    def topological_sort(self) -> list:
+        """
+        Returns vertices ordered so that every edge goes from an earlier
+        to a later vertex (Kahn's algorithm), empty list if graph has a
+        cycle, once computed the order is kept up to date by add_edge()
+        """
+        if self._topo is None:
+            self._topo_build()
+        if self._topo is None:
+            return []
+        return [v for v in self._topo if v not in self._removed]
+
+    @synchronized
+    def add_dag_edge(self, src: int, dst: int, weight=1) -> bool:
+        """
+        Adds/updates edge like add_edge() unless it would close a cycle,
+        returns True if edge was added or updated, False otherwise
+        Only vertices between dst and src in topological order are checked
+        """
+        self._check_writable()
+        if not self._has_vertex(src) or not self._has_vertex(dst) \
+            or weight < 1 or src == dst:
+            return False
+        if self._topo is None:
+            self._topo_build()
+        if self._topo is not None:
+            if not self._topo_insert(src, dst):
+                return False
+        # Graph already has a cycle elsewhere, search for dst -> src path
+        elif src in self.iter_dfs(dst):
+            return False
+        self.add_edge(src, dst, weight)
+        return True
+
+    @instrumented
+    @cached
+    def dag_distances(self, src: int, longest=False) -> list:
+        """
+        Returns shortest (or longest) path lengths from source to all
+        vertices by relaxing edges in topological order in O(V + E),
+        unreachable vertices have value float('inf') (float('-inf') if
+        longest), empty list if graph has a cycle
+        """
+        distances, _ = self._dag_tree(src, longest)
+        return distances
+
+    @instrumented
+    @cached
+    def dag_path(self, src: int, dst: int, longest=False) -> tuple:
+        """
+        Returns tuple (distance, path) for shortest (or longest) path
+        from src to dst, unreachable or invalid vertices and cyclic
+        graphs give (float('inf'), []) (float('-inf') if longest)
+        """
+        distances, predecessors = self._dag_tree(src, longest)
+        unreached = float('-inf') if longest else float('inf')
+        if not distances or not self._has_vertex(dst) \
+                or distances[dst] == unreached:
+            return unreached, []
+
+        return distances[dst], _walk_path(predecessors, src, dst)
+
+    # Async variants run on snapshot() so writers are never blocked,
+    # and hand control back to the event loop every yield_every rows
+    # copied or vertex expansions; timeout raises asyncio.TimeoutError
+    # (see graph_async)
+
+    async def dfs_async(self, v_start, v_end=None, yield_every=YIELD_EVERY,
+                        timeout=None) -> list:
+        """
+        Awaitable dfs()
+        """
+        steps = on_snapshot(self, lambda view: collect(
+            view.iter_dfs(v_start), v_end))
+        return await run_steps(steps, yield_every, timeout)
+
+    async def bfs_async(self, v_start, v_end=None, yield_every=YIELD_EVERY,
+                        timeout=None) -> list:
+        """
+        Awaitable bfs()
+        """
+        steps = on_snapshot(self, lambda view: collect(
+            view.iter_bfs(v_start), v_end))
+        return await run_steps(steps, yield_every, timeout)
+
+    async def has_cycle_async(self, yield_every=YIELD_EVERY,
+                              timeout=None) -> bool:
+        """
+        Awaitable has_cycle()
+        """
+        return await self.find_cycle_async(yield_every, timeout) != []
+
+    async def find_cycle_async(self, yield_every=YIELD_EVERY,
+                               timeout=None) -> list:
+        """
+        Awaitable find_cycle()
+        """
+        steps = on_snapshot(self, lambda view: view._find_cycle_steps())
+        return await run_steps(steps, yield_every, timeout)
+
+    async def dijkstra_async(self, src: int, target=None,
+                             yield_every=YIELD_EVERY, timeout=None) -> list:
+        """
+        Awaitable dijkstra()
+        """
+        steps = on_snapshot(
+            self, lambda view: view._dijkstra_steps(src, target))
+        distances, _ = await run_steps(steps, yield_every, timeout)
+        return distances
+
+    async def shortest_path_async(self, src: int, dst: int,
+                                  yield_every=YIELD_EVERY,
+                                  timeout=None) -> tuple:
+        """
+        Awaitable shortest_path()
+        """
+        steps = on_snapshot(
+            self, lambda view: view._dijkstra_steps(src, dst))
+        distances, predecessors = await run_steps(steps, yield_every,
+                                                  timeout)
+        if dst < 0 or dst >= len(distances) \
+                or distances[dst] == float('inf'):
+            return float('inf'), []
+
+        return distances[dst], _walk_path(predecessors, src, dst)
+
+    def enable_concurrency(self) -> None:
+        """
+        Makes mutations take a lock from now on, so the graph can be
+        changed from several threads; off by default since the lock
+        slows down every mutation
+        """
+        if self._lock is NO_LOCK:
+            self._lock = make_lock(True)
+
+    def disable_concurrency(self) -> None:
+        """
+        Makes mutations stop taking the lock, only call this while no
+        other thread uses the graph
+        """
+        self._lock = NO_LOCK
+
+    def enable_stats(self, callback=None) -> GraphStats:
+        """
+        Turns on instrumentation and returns the GraphStats collecting it,
+        callback(method, seconds) is called after every public method call
+        """
+        self.stats = GraphStats(callback)
+        return self.stats
+
+    def disable_stats(self) -> dict:
+        """
+        Turns off instrumentation, returns what was collected as dict
+        """
+        stats, self.stats = self.stats, None
+        return stats.as_dict() if stats is not None else {}
+
+    @instrumented
+    def to_numpy(self):
+        """
+        Returns copy of adjacency matrix as NumPy int64 array, float64
+        if any weight is not an int
+        """
+        _require_numpy()
+        if self.storage == 'numpy':
+            return self.adj_matrix.copy()
+        edges = list(self.iter_edges())
+        matrix = np.zeros((self.v_count, self.v_count), dtype=np.int64
+                          if _all_ints(w for _, _, w in edges)
+                          else np.float64)
+        for src, dst, weight in edges:
+            matrix[src, dst] = weight
+        return matrix
+
+    @instrumented
+    def all_pairs_distances(self):
+        """
+        Returns NumPy array of shortest path lengths between all vertices
+        using vectorized Floyd-Warshall, unreachable pairs are inf
+        Row i matches dijkstra(i)
+        """
+        matrix = self._np_matrix()
+        distances = np.where(matrix > 0, matrix, np.inf)
+        np.fill_diagonal(distances, 0)
+        # Row and column k do not change during pass k, so update in place
+        for k in range(self.v_count):
+            np.minimum(distances, distances[:, k, None] + distances[k],
+                       out=distances)
+        return distances
+
+    @instrumented
+    def bfs_levels(self, v_start):
+        """
+        Returns NumPy array of hop counts from v_start found by
+        boolean frontier expansion, -1 for unreachable vertices
+        """
+        matrix = self._np_matrix()
+        levels = np.full(self.v_count, -1, dtype=np.int64)
+        if not self._has_vertex(v_start):
+            return levels
+
+        adjacent = matrix > 0
+        frontier = np.zeros(self.v_count, dtype=bool)
+        frontier[v_start] = True
+        levels[v_start] = 0
+        depth = 0
+        while frontier.any():
+            depth += 1
+            # Union of frontier rows, minus already reached vertices
+            frontier = adjacent[frontier].any(axis=0) & (levels < 0)
+            levels[frontier] = depth
+        return levels
+
+    @instrumented
+    def reachability_matrix(self):
+        """
+        Returns NumPy bool array where [u, v] is True if v can be
+        reached from u (every vertex reaches itself)
+        """
+        matrix = self._np_matrix()
+        reach = (matrix > 0) | np.eye(self.v_count, dtype=bool)
+        # Squaring doubles covered path length, so O(log V) products
+        while True:
+            weights = reach.astype(np.float32)
+            closure = (weights @ weights) > 0
+            if np.array_equal(closure, reach):
+                return reach
+            reach = closure
+
+    def _np_fit(self, weights) -> None:
+        """
+        Switches NumPy storage to float64 before weights that are not
+        ints are written, int64 would truncate them
+        """
+        if self._np_buffer.dtype == np.int64 and not _all_ints(weights):
+            self._np_buffer = self._np_buffer.astype(np.float64)
+            self.adj_matrix = self._np_buffer[:self.v_count, :self.v_count]
 
-        # Queue keeps track of adjacents, keeps out already-visited nodes
-        queue = [src]
+    def _np_matrix(self):
+        """
+        Returns adjacency matrix as NumPy array without copying if possible
+        """
+        if self.storage == 'numpy':
+            return self.adj_matrix
+        return self.to_numpy()
+
+    def _check_writable(self) -> None:
+        """
+        Raises TypeError when graph storage cannot be mutated
+        """
+        if self.storage == 'csr':
+            raise TypeError('CSR storage is read-only')
 
+    def _grow(self, v_count: int) -> None:
+        """
+        Extends storage with vertices without edges up to v_count
+        """
+        added = v_count - self.v_count
+        if added <= 0:
+            return
+        # Sparse rows only hold existing edges
+        if self.storage == 'sparse':
+            self.adj_list.extend({} for _ in range(added))
+        elif self.storage == 'numpy':
+            if v_count > len(self._np_buffer):
+                buffer = np.zeros((2 * v_count, 2 * v_count),
+                                  dtype=self._np_buffer.dtype)
+                buffer[:self.v_count, :self.v_count] = self.adj_matrix
+                self._np_buffer = buffer
+            self.adj_matrix = self._np_buffer[:v_count, :v_count]
+        else:
+            # Update number of columns in each row
+            for row in self.adj_matrix:
+                row.extend([0] * added)
+            self.adj_matrix.extend([0] * v_count for _ in range(added))
+        self.v_count = v_count
+
+    def _topo_build(self) -> None:
+        """
+        Computes topological order with Kahn's algorithm,
+        self._topo stays None if graph has a cycle
+        """
+        preds = [set() for _ in range(self.v_count)]
+        for v in range(self.v_count):
+            for i in self._adjacent(v):
+                preds[i].add(v)
+        in_degree = [len(sources) for sources in preds]
+
+        # Repeatedly take vertices with no remaining incoming edges
+        queue = deque(v for v in range(self.v_count) if in_degree[v] == 0)
+        order = []
         while queue:
-            v = queue.pop(0)
-            for i in range(self.v_count):
-                if self.adj_matrix[v][i] > 0:
-                    # Queue will only update with shortest path from 'v' to its adjacents
-                    if (distances[v] + self.adj_matrix[v][i]) < distances[i]:
-                        distances[i] = distances[v] + self.adj_matrix[v][i]
-                        # Visited nodes have already loaded their adjacents into queue
-                        if i not in queue:
-                            queue.append(i)
+            v = queue.popleft()
+            order.append(v)
+            for i in self._adjacent(v):
+                in_degree[i] -= 1
+                if in_degree[i] == 0:
+                    queue.append(i)
+
+        # Vertices on or behind a cycle never reach in-degree zero
+        if len(order) < self.v_count:
+            return
+        position = [0] * self.v_count
+        for i, v in enumerate(order):
+            position[v] = i
+        # Order is set last, it marks the other two as ready
+        self._topo_pos = position
+        self._topo_preds = preds
+        self._topo = order
+
+    def _topo_insert(self, src: int, dst: int) -> bool:
+        """
+        Updates topological order for new edge src -> dst (Pearce-Kelly),
+        only vertices between dst and src that are reachable from dst or
+        reach src are moved, returns False without changes if the edge
+        would close a cycle
+        """
+        position = self._topo_pos
+        lower, upper = position[dst], position[src]
+        if lower > upper:
+            return True
+
+        # Vertices reachable from dst that are not already after src
+        forward = {dst}
+        stack = [dst]
+        while stack:
+            v = stack.pop()
+            for i in self._adjacent(v):
+                if i == src:
+                    return False
+                if position[i] < upper and i not in forward:
+                    forward.add(i)
+                    stack.append(i)
+
+        # Vertices reaching src that are not already before dst
+        backward = {src}
+        stack = [src]
+        while stack:
+            v = stack.pop()
+            for i in self._topo_preds[v]:
+                if position[i] > lower and i not in backward:
+                    backward.add(i)
+                    stack.append(i)
+
+        # Affected vertices swap into the same slots, backward set first,
+        # each set keeping its relative order
+        backward = sorted(backward, key=position.__getitem__)
+        forward = sorted(forward, key=position.__getitem__)
+        slots = sorted(position[v] for v in backward + forward)
+        for slot, v in zip(slots, backward + forward):
+            position[v] = slot
+            self._topo[slot] = v
+        return True
+
+    def _reach_build(self) -> None:
+        """
+        Builds reachability index over strongly connected components,
+        reach[c] has bit d set if component c reaches component d
+        Above REACH_BITSET_LIMIT components the component DAG is
+        labeled with intervals instead (see _reach_search)
+        """
+        components = self.strongly_connected_components()
+        component = [None] * self.v_count
+        for c, members in enumerate(components):
+            for v in members:
+                component[v] = c
+        self._reach_updates = 0
+        if len(components) > self.REACH_BITSET_LIMIT:
+            # Edges between components as CSR, successors sorted
+            offsets = array('q', [0])
+            targets = array('i')
+            for c, members in enumerate(components):
+                successors = {component[i] for v in members
+                              for i in self._adjacent(v)}
+                successors.discard(c)
+                targets.extend(sorted(successors))
+                offsets.append(len(targets))
+            self._reach_labels = [
+                _interval_labels(offsets, targets, reverse=n % 2 == 1)
+                for n in range(self.REACH_LABELINGS)]
+            self._reach_comp = component
+            self._reach = (offsets, targets)
+            return
+        self._reach_labels = None
+
+        # Components are in topological order, so successors come later
+        # and are finished first when walking backwards
+        reach = [0] * len(components)
+        for c in range(len(components) - 1, -1, -1):
+            bits = 1 << c
+            for v in components[c]:
+                for i in self._adjacent(v):
+                    if component[i] != c:
+                        bits |= reach[component[i]]
+            reach[c] = bits
+        # Bitsets are set last, they mark the component map as ready
+        self._reach_comp = component
+        self._reach = reach
+
+    def _reach_insert(self, src: int, dst: int) -> None:
+        """
+        Updates reachability index for new edge src -> dst
+        """
+        reach, component = self._reach, self._reach_comp
+        src_c, dst_c = component[src], component[dst]
+        if self._reach_labels is not None:
+            # Labels stay valid only if the component DAG keeps its edges
+            offsets, targets = reach
+            if src_c != dst_c and dst_c not in \
+                    targets[offsets[src_c]:offsets[src_c + 1]]:
+                self._reach = None
+            return
+        if reach[src_c] >> dst_c & 1:
+            return
+        if reach[dst_c] >> src_c & 1:
+            # Edge merges components, index is rebuilt on demand
+            self._reach = None
+            return
+        # Each update touches every component, past the limit one
+        # rebuild on the next query is cheaper
+        self._reach_updates += 1
+        if self._reach_updates > self.REACH_UPDATE_LIMIT:
+            self._reach = None
+            return
+        # Everything reaching src now also reaches what dst reaches
+        dst_reach = reach[dst_c]
+        for c, bits in enumerate(reach):
+            if bits >> src_c & 1:
+                reach[c] = bits | dst_reach
+
+    def _reach_search(self, source: int, target: int) -> bool:
+        """
+        Returns True if component source reaches component target
+        A component whose interval does not contain the target's in
+        every labeling cannot reach it, so most unreachable pairs are
+        answered without a search and the search skips such components
+        """
+        if source >= target:
+            return source == target
+        offsets, targets = self._reach
+        labels = self._reach_labels
+        for low, rank, first in labels:
+            if low[source] > low[target] or rank[source] < rank[target]:
+                return False
+        # Target first seen while source was on the DFS stack is
+        # reached from it
+        for low, rank, first in labels:
+            if first[source] <= first[target] \
+                    and rank[target] <= rank[source]:
+                return True
+        bounds = [(low, rank, low[target], rank[target])
+                  for low, rank, first in labels]
+        # Components ordered after the target cannot reach it
+        seen = {source}
+        stack = [source]
+        while stack:
+            c = stack.pop()
+            for d in targets[offsets[c]:offsets[c + 1]]:
+                if d == target:
+                    return True
+                if d > target or d in seen:
+                    continue
+                seen.add(d)
+                for low, rank, target_low, target_rank in bounds:
+                    if low[d] > target_low or rank[d] < target_rank:
+                        break
+                else:
+                    stack.append(d)
+        return False
+
+    def _find_cycle_steps(self):
+        """
+        Step generator behind find_cycle(), yields once per vertex
+        entered by the search
+        """
+        # Three-color DFS: 0 = unvisited, 1 = on current path, 2 = finished
+        color = [0] * self.v_count
+        parent = [None] * self.v_count
+        stats = self.stats
+
+        # Check every connected component
+        for root in range(self.v_count):
+            if color[root] != 0:
+                continue
+            # Negative entries mark vertex as finished once popped
+            stack = [root]
+            while stack:
+                if stats is not None:
+                    stats.count('find_cycle.vertices_popped')
+                    stats.mark('find_cycle.stack', len(stack))
+                v = stack.pop()
+                if v < 0:
+                    color[~v] = 2
+                    continue
+                if color[v] != 0:
+                    continue
+                color[v] = 1
+                yield
+                stack.append(~v)
+                for i in self._adjacent(v):
+                    if color[i] == 0:
+                        parent[i] = v
+                        stack.append(i)
+                    # Edge back to vertex on current path closes a cycle
+                    elif color[i] == 1:
+                        cycle = [v]
+                        while cycle[-1] != i:
+                            cycle.append(parent[cycle[-1]])
+                        cycle.reverse()
+                        return cycle
+        return []
+
+    def _dijkstra_steps(self, src: int, target=None):
+        """
+        Step generator behind dijkstra_tree(), yields once per
+        settled vertex
+        """
+        distances = [float('inf')] * self.v_count
+        predecessors = [None] * self.v_count
+
+        # Catch invalid indices
+        if not self._has_vertex(src):
+            return distances, predecessors
+        if target is not None and not self._has_vertex(target):
+            target = None
+
+        distances[src] = 0
+        settled = [False] * self.v_count
+
+        # Heap holds (distance, vertex), stale entries are skipped on pop
+        stats = self.stats
+        heap = [(0, src)]
+        while heap:
+            if stats is not None:
+                stats.count('dijkstra.vertices_popped')
+                stats.mark('dijkstra.heap', len(heap))
+            dist, v = heapq.heappop(heap)
+            if settled[v]:
+                continue
+            settled[v] = True
+            yield
+            if v == target:
+                break
+            for i, weight in self._neighbors(v):
+                if not settled[i] and dist + weight < distances[i]:
+                    distances[i] = dist + weight
+                    predecessors[i] = v
+                    heapq.heappush(heap, (distances[i], i))
+                    if stats is not None:
+                        stats.count('dijkstra.edges_relaxed')
 
         # Shortest paths to all reachable vertices found
-        return distances
+        return distances, predecessors
+
+    def _dag_tree(self, src: int, longest: bool) -> tuple:
+        """
+        Relaxes edges in topological order from source and returns tuple
+        (distances, predecessors), two empty lists if graph has a cycle
+        """
+        if self._topo is None:
+            self._topo_build()
+        if self._topo is None:
+            return [], []
+
+        # Longest paths are shortest paths with negated weights
+        sign = -1 if longest else 1
+        distances = [float('inf')] * self.v_count
+        predecessors = [None] * self.v_count
+        if self._has_vertex(src):
+            distances[src] = 0
+            # Vertices before source in the order cannot be reached
+            for v in self._topo[self._topo_pos[src]:]:
+                dist = distances[v]
+                if dist == float('inf'):
+                    continue
+                for i, weight in self._neighbors(v):
+                    if dist + sign * weight < distances[i]:
+                        distances[i] = dist + sign * weight
+                        predecessors[i] = v
+        if longest:
+            distances = [-dist for dist in distances]
+        return distances, predecessors
+
+    def _in_neighbors(self, v: int) -> list:
+        """
+        Returns (src, weight) tuples of incoming edges
+        """
+        if self.storage == 'dense':
+            return [(i, row[v]) for i, row in enumerate(self.adj_matrix)
+                    if row[v] > 0]
+        elif self.storage == 'numpy':
+            column = self.adj_matrix[:, v]
+            adjacent = np.flatnonzero(column)
+            return list(zip(adjacent.tolist(), column[adjacent].tolist()))
+        # Sparse and CSR rows have no column access, so incoming edges
+        # are collected once per graph version
+        if self._reverse_version != self._version:
+            reverse = [[] for _ in range(self.v_count)]
+            for src, dst, weight in self.iter_edges():
+                reverse[dst].append((src, weight))
+            self._reverse = reverse
+            self._reverse_version = self._version
+        return self._reverse[v]
+
+    def _has_vertex(self, v: int) -> bool:
+        """
+        Returns True if index is a vertex that was not removed
+        """
+        return 0 <= v < self.v_count and v not in self._removed
+
+    def _row(self, v: int) -> list:
+        """
+        Returns full row of weights for vertex, zero where no edge
+        """
+        if self.storage == 'dense':
+            return self.adj_matrix[v]
+        row = [0] * self.v_count
+        for dst, weight in self._neighbors(v):
+            row[dst] = weight
+        return row
+
+    def _neighbors(self, v: int) -> list:
+        """
+        Returns (dst, weight) tuples of outgoing edges,
+        sorted by dst in ascending order
+        """
+        if self.storage == 'sparse':
+            row = self.adj_list[v]
+            return [(i, row[i]) for i in self._adjacent(v)]
+        elif self.storage == 'csr':
+            offsets, targets, weights = self.adj_csr
+            start, end = offsets[v], offsets[v + 1]
+            return list(zip(targets[start:end], weights[start:end]))
+        elif self.storage == 'numpy':
+            row = self.adj_matrix[v]
+            adjacent = np.flatnonzero(row)
+            return list(zip(adjacent.tolist(), row[adjacent].tolist()))
+        return [(i, w) for i, w in enumerate(self.adj_matrix[v]) if w > 0]
+
+    def _adjacent(self, v: int) -> list:
+        """
+        Returns destinations of outgoing edges in ascending order
+        """
+        if self.storage == 'sparse':
+            adjacent = self._sorted_adj.get(v)
+            if adjacent is None:
+                adjacent = sorted(self.adj_list[v])
+                self._sorted_adj[v] = adjacent
+            return adjacent
+        elif self.storage == 'csr':
+            offsets, targets, _ = self.adj_csr
+            return targets[offsets[v]:offsets[v + 1]]
+        elif self.storage == 'numpy':
+            return np.flatnonzero(self.adj_matrix[v]).tolist()
+        return [i for i, w in enumerate(self.adj_matrix[v]) if w > 0]
+
+    def _weight(self, src: int, dst: int) -> int:
+        """
+        Returns weight of edge src -> dst, zero if no edge
+        """
+        if self.storage == 'sparse':
+            return self.adj_list[src].get(dst, 0)
+        elif self.storage == 'csr':
+            # Targets of each vertex are sorted, so binary search the slice
+            offsets, targets, weights = self.adj_csr
+            start, end = offsets[src], offsets[src + 1]
+            i = bisect_left(targets, dst, start, end)
+            if i < end and targets[i] == dst:
+                return weights[i]
+            return 0
+        elif self.storage == 'numpy':
+            return self.adj_matrix[src, dst].item()
+        return self.adj_matrix[src][dst]
+
+
+def _require_numpy() -> None:
+    """
+    Raises ImportError when optional NumPy dependency is missing
+    """
+    if np is None:
+        raise ImportError('NumPy is required for this DirectedGraph feature')
+
+
+def _all_ints(weights) -> bool:
+    """
+    Returns True if every weight is an int (or NumPy integer)
+    """
+    try:
+        for weight in weights:
+            operator.index(weight)
+    except TypeError:
+        return False
+    return True
+
+
+def _no_heuristic(v: int, dst: int) -> int:
+    """
+    Default A* heuristic, turns astar() into dijkstra
+    """
+    return 0
+
+
+def _walk_path(predecessors: list, src: int, dst: int) -> list:
+    """
+    Returns path from src to dst, walking predecessors back from dst
+    """
+    path = [dst]
+    while path[-1] != src:
+        path.append(predecessors[path[-1]])
+    path.reverse()
+    return path
+
+
+def _interval_labels(offsets, targets, reverse=False) -> tuple:
+    """
+    Returns (low, rank, first) arrays for DAG given as CSR arrays: rank
+    is the post-order number of a DFS over all nodes and low the
+    smallest rank among the node and its descendants, so a node
+    reaching another has an interval [low, rank] containing the other's
+    first is the pre-order number, nodes first seen while a node is on
+    the stack are reached from it
+    Roots and successors are visited backwards if reverse is True
+    """
+    count = len(offsets) - 1
+    low = array('i', [0]) * count
+    rank = array('i', [-1]) * count
+    first = array('i', [0]) * count
+    visited = bytearray(count)
+    step = -1 if reverse else 1
+    next_first = next_rank = 0
+    for root in range(count)[::step]:
+        if visited[root]:
+            continue
+        stack = [root]
+        while stack:
+            c = stack[-1]
+            successors = targets[offsets[c]:offsets[c + 1]]
+            if not visited[c]:
+                # Node stays on the stack until its successors finish
+                visited[c] = 1
+                first[c] = next_first
+                next_first += 1
+                stack.extend(d for d in successors[::-step]
+                             if not visited[d])
+                continue
+            stack.pop()
+            if rank[c] != -1:
+                continue
+            rank[c] = next_rank
+            low[c] = min([next_rank] + [low[d] for d in successors])
+            next_rank += 1
+    return low, rank, first
+
+
+def pack_csr(rows) -> tuple:
+    """
+    Packs iterable of per-vertex (dst, weight) lists, sorted by dst,
+    into (offsets, targets, weights) arrays
+    Weights are ints ('q'), or floats ('d') if any weight is not an int
+    """
+    return drain(_pack_steps(rows))
+
+
+def _pack_steps(rows):
+    """
+    Step generator behind pack_csr(), yields once per row
+    """
+    offsets = array('q', [0])
+    targets = array('i')
+    weights = array('q')
+    for row in rows:
+        for dst, weight in row:
+            targets.append(dst)
+            try:
+                weights.append(weight)
+            except TypeError:
+                weights = array('d', weights)
+                weights.append(weight)
+        offsets.append(len(targets))
+        yield
+    return offsets, targets, weights
 
 
 if __name__ == '__main__':
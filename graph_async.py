@@ -0,0 +1,93 @@
+# Author: Philip Beck
+# Email: stoneroll6@gmail.com
+# Date: 1/17/2021
+# Description:
+#    Asyncio helpers for DirectedGraph
+#    and UndirectedGraph queries
+#    For educational use only,
+#    Not for commercial use
+
+import asyncio
+from functools import partial
+
+# Vertex expansions between two yields to the event loop
+YIELD_EVERY = 1024
+
+
+def drain(steps):
+    """
+    Runs step generator to completion and returns its result
+    """
+    try:
+        while True:
+            next(steps)
+    except StopIteration as done:
+        return done.value
+
+
+def collect(vertices, v_end=None):
+    """
+    Step generator yielding once per vertex of iterator, returns
+    list of vertices up to and including v_end
+    """
+    order = []
+    for v in vertices:
+        order.append(v)
+        if v == v_end:
+            break
+        yield
+    return order
+
+
+def on_snapshot(graph, query):
+    """
+    Step generator copying graph with its snapshot steps, then running
+    the step generator query(snapshot) and returning its result, so
+    the copy does not block the event loop either
+    """
+    view = yield from graph._snapshot_steps()
+    return (yield from query(view))
+
+
+async def run_steps(steps, yield_every=YIELD_EVERY, timeout=None):
+    """
+    Runs step generator on the event loop, handing control back to
+    other tasks after every yield_every steps, and returns its result
+    Raises asyncio.TimeoutError once timeout seconds have passed,
+    cancelling the awaiting task stops the generator at the next yield
+    """
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    yield_every = max(1, yield_every)
+    count = 0
+    try:
+        while True:
+            next(steps)
+            count += 1
+            if count < yield_every:
+                continue
+            count = 0
+            if deadline is not None and loop.time() >= deadline:
+                raise asyncio.TimeoutError
+            await asyncio.sleep(0)
+    except StopIteration as done:
+        return done.value
+    finally:
+        steps.close()
+
+
+async def offload(graph, method: str, *args, executor=None, timeout=None):
+    """
+    Runs graph.method(*args) on a snapshot of the graph in executor
+    (default thread pool if None) and returns its result
+    Raises asyncio.TimeoutError once timeout seconds have passed, the
+    worker thread then finishes in the background
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    view = await run_steps(graph._snapshot_steps(), timeout=timeout)
+    if timeout is not None:
+        timeout = max(0, timeout - (loop.time() - start))
+    call = partial(getattr(view, method), *args)
+    return await asyncio.wait_for(loop.run_in_executor(executor, call),
+                                  timeout)
@@ -0,0 +1,101 @@
+# Author: Philip Beck
+# Email: stoneroll6@gmail.com
+# Date: 1/17/2021
+# Description:
+#    LRU result cache for DirectedGraph
+#    and UndirectedGraph queries
+#    For educational use only,
+#    Not for commercial use
+
+from collections import OrderedDict
+from functools import wraps
+
+
+class ResultCache(OrderedDict):
+    """
+    Cached results in LRU order, size is the total of _size() over
+    the stored results
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.size = 0
+
+    def clear(self) -> None:
+        super().clear()
+        self.size = 0
+
+
+def _size(result) -> int:
+    """
+    Return number of items in result, 1 for a single value
+    """
+    if isinstance(result, list):
+        return len(result) or 1
+    if isinstance(result, tuple):
+        return sum(_size(item) for item in result) or 1
+    return 1
+
+
+def _fresh(result):
+    """
+    Return copy of cached result that callers are free to modify
+    """
+    if isinstance(result, list):
+        return list(result)
+    if isinstance(result, tuple):
+        return tuple(_fresh(item) for item in result)
+    return result
+
+
+def cached(method):
+    """
+    Decorator memoizing method results per (method, arguments)
+    Graph keeps results in self._cache (ResultCache) for self._version,
+    mutations bump the version and the cache is dropped on the next
+    lookup; results hold at most self.cache_size items in total, so a
+    result larger than that is never stored
+    """
+    name = method.__name__
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.cache_size <= 0:
+            return method(self, *args, **kwargs)
+        key = (name, args, tuple(sorted(kwargs.items())))
+        if self._cache_version != self._version:
+            self._cache.clear()
+            self._cache_version = self._version
+        try:
+            result, size = self._cache[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # Unhashable arguments are never cached
+            return method(self, *args, **kwargs)
+        else:
+            try:
+                self._cache.move_to_end(key)
+            except KeyError:
+                # Evicted by another thread reading the same snapshot
+                pass
+            if self.stats is not None:
+                self.stats.count('cache.hits')
+            return _fresh(result)
+
+        if self.stats is not None:
+            self.stats.count('cache.misses')
+        result = method(self, *args, **kwargs)
+        size = _size(result)
+        # Skip storing if the graph was mutated while method ran
+        if self._cache_version == self._version and size <= self.cache_size:
+            cache = self._cache
+            cache[key] = (_fresh(result), size)
+            cache.size += size
+            while cache.size > self.cache_size:
+                try:
+                    cache.size -= cache.popitem(last=False)[1][1]
+                except KeyError:
+                    break
+        return result
+    return wrapper
@@ -0,0 +1,238 @@
+# Author: Philip Beck
+# Email: stoneroll6@gmail.com
+# Date: 1/17/2021
+# Description:
+#    Compact binary save/load for DirectedGraph
+#    and UndirectedGraph with mmap support,
+#    streaming edge-list reader/writer
+#    For educational use only,
+#    Not for commercial use
+
+import csv
+import mmap as mmap_module
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Sequence
+from contextlib import contextmanager
+from itertools import islice
+
+from d_graph import DirectedGraph
+from ud_graph import UndirectedGraph
+
+# File layout (little-endian):
+#    header  -> magic, flags, vertex count, edge count
+#    directed   -> offsets (q), weights (q, or d if flags has
+#                  FLOAT_WEIGHTS), targets (i), and if flags has
+#                  TOMBSTONES: padding to 8 bytes, count (q) and
+#                  indices (q) of removed vertices
+#    undirected -> name offsets (q), offsets (q), targets (i),
+#                  padding to 8 bytes, UTF-8 name table
+# Undirected vertex ids follow sorted name order, so neighbor lists
+# are stored alphabetically and names are found by binary search
+DIRECTED_MAGIC = b'DGR1'
+UNDIRECTED_MAGIC = b'UGR1'
+HEADER = struct.Struct('<4sIQQ')
+FLOAT_WEIGHTS = 1
+TOMBSTONES = 2
+
+
+class MappedNames(Sequence):
+    """
+    Read-only sequence of vertex names over UTF-8 name table,
+    names are decoded on lookup instead of at load time
+    """
+
+    def __init__(self, name_offsets, names):
+        self.name_offsets = name_offsets
+        self.names = names
+
+    def __getitem__(self, i) -> str:
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        start, end = self.name_offsets[i], self.name_offsets[i + 1]
+        return bytes(self.names[start:end]).decode('utf-8')
+
+    def __len__(self) -> int:
+        return len(self.name_offsets) - 1
+
+
+def save_graph(graph, path) -> None:
+    """
+    Write DirectedGraph or UndirectedGraph to binary file
+    """
+    if isinstance(graph, DirectedGraph):
+        offsets, targets, weights = graph.to_csr()
+        chunks = [offsets, weights, targets]
+        flags = FLOAT_WEIGHTS if weights.typecode == 'd' else 0
+        if graph._removed:
+            flags |= TOMBSTONES
+            removed = array('q', sorted(graph._removed))
+            chunks += [b'\0' * (len(targets) % 2 * 4),
+                       array('q', [len(removed)]), removed]
+        header = HEADER.pack(DIRECTED_MAGIC, flags, graph.v_count,
+                             len(targets))
+    elif isinstance(graph, UndirectedGraph):
+        names = sorted(graph.adj_list)
+        ids = {name: i for i, name in enumerate(names)}
+        name_offsets = array('q', [0])
+        offsets = array('q', [0])
+        targets = array('i')
+        blob = bytearray()
+        for name in names:
+            blob += name.encode('utf-8')
+            name_offsets.append(len(blob))
+            targets.extend(sorted(ids[v] for v in graph.adj_list[name]))
+            offsets.append(len(targets))
+        # Keep following reads aligned after 4-byte targets
+        padding = b'\0' * (len(targets) % 2 * 4)
+        chunks = [name_offsets, offsets, targets, padding, blob]
+        header = HEADER.pack(UNDIRECTED_MAGIC, 0, len(names), len(targets))
+    else:
+        raise TypeError(f'Cannot save {type(graph).__name__}')
+
+    with open(path, 'wb') as f:
+        f.write(header)
+        for chunk in chunks:
+            if isinstance(chunk, array) and sys.byteorder == 'big':
+                chunk = array(chunk.typecode, chunk)
+                chunk.byteswap()
+            f.write(chunk)
+
+
+def load_graph(path, mmap=True):
+    """
+    Read graph saved by save_graph(), returns read-only graph
+    If mmap is True, queries run directly off the mapped file and
+    the pages are shared between processes mapping the same file
+    """
+    with open(path, 'rb') as f:
+        if mmap:
+            buf = mmap_module.mmap(f.fileno(), 0,
+                                   access=mmap_module.ACCESS_READ)
+        else:
+            buf = f.read()
+    view = memoryview(buf)
+    if len(view) < HEADER.size:
+        raise ValueError(f'{path} is not a graph file')
+    magic, flags, v_count, e_count = HEADER.unpack_from(view)
+    pos = HEADER.size
+
+    def take(typecode, count):
+        """
+        Return next array of buffer as typed view
+        """
+        nonlocal pos
+        size = array(typecode).itemsize * count
+        chunk = view[pos:pos + size].cast(typecode)
+        pos += size
+        # Native views only work on little-endian hosts, copy otherwise
+        if sys.byteorder == 'big':
+            chunk = array(typecode, chunk)
+            chunk.byteswap()
+        return chunk
+
+    if magic == DIRECTED_MAGIC:
+        offsets = take('q', v_count + 1)
+        weights = take('d' if flags & FLOAT_WEIGHTS else 'q', e_count)
+        targets = take('i', e_count)
+        removed = ()
+        if flags & TOMBSTONES:
+            pos += e_count % 2 * 4
+            removed = take('q', take('q', 1)[0])
+        return DirectedGraph.from_csr(offsets, targets, weights, removed)
+    elif magic == UNDIRECTED_MAGIC:
+        name_offsets = take('q', v_count + 1)
+        offsets = take('q', v_count + 1)
+        targets = take('i', e_count)
+        pos += e_count % 2 * 4
+        names = MappedNames(name_offsets, view[pos:])
+        return UndirectedGraph.from_csr(names, offsets, targets)
+    raise ValueError(f'{path} is not a graph file')
+
+
+@contextmanager
+def _open_text(source, mode):
+    """
+    Open path for text I/O, or pass through an open file object
+    """
+    if isinstance(source, (str, bytes, os.PathLike)):
+        with open(source, mode, newline='', encoding='utf-8') as f:
+            yield f
+    else:
+        yield source
+
+
+def _parse_weight(text: str):
+    """
+    Parse edge weight as int when possible, float otherwise
+    """
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def read_edges(source, directed=True, delimiter=None):
+    """
+    Yield edges from CSV/TSV edge list one line at a time,
+    (src, dst, weight) int triples if directed, else (u, v) string pairs
+    Missing weights default to 1, blank lines and '#' comments are skipped
+    delimiter=None splits on tabs, commas or whitespace per line
+    """
+    with _open_text(source, 'r') as f:
+        if delimiter is not None:
+            rows = csv.reader(f, delimiter=delimiter)
+        else:
+            rows = (line.replace(',', ' ').split() for line in f)
+        for row in rows:
+            if not row or row[0].startswith('#'):
+                continue
+            if directed:
+                weight = _parse_weight(row[2]) if len(row) > 2 else 1
+                yield int(row[0]), int(row[1]), weight
+            else:
+                yield row[0], row[1]
+
+
+def iter_chunks(edges, chunk_size=65536):
+    """
+    Yield lists of at most chunk_size edges from any edge iterable
+    """
+    edges = iter(edges)
+    while True:
+        chunk = list(islice(edges, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def stream_into(graph, edges, chunk_size=65536):
+    """
+    Add edges from iterable to graph one chunk at a time, so only
+    the current chunk is held in memory besides the graph itself
+    Returns the graph
+    """
+    directed = isinstance(graph, DirectedGraph)
+    for chunk in iter_chunks(edges, chunk_size):
+        if directed:
+            # Each chunk is one batch, so the vertex range grows once
+            top = max(max(u, v) for u, v, _ in chunk)
+            edits = [('add_vertex',)] * (top + 1 - graph.v_count)
+            edits += [('add_edge', u, v, weight) for u, v, weight in chunk]
+            graph.apply_edits(edits)
+        else:
+            for u, v in chunk:
+                graph.add_edge(u, v)
+    return graph
+
+
+def write_edges(graph, target, delimiter='\t') -> None:
+    """
+    Write graph edges to CSV/TSV file as they are generated,
+    without building the full get_edges() list
+    """
+    with _open_text(target, 'w') as f:
+        writer = csv.writer(f, delimiter=delimiter, lineterminator='\n')
+        writer.writerows(graph.iter_edges())
@@ -0,0 +1,339 @@
+# Author: Philip Beck
+# Email: stoneroll6@gmail.com
+# Date: 1/17/2021
+# Description:
+#    Append-only binary change log for DirectedGraph
+#    and UndirectedGraph, replayed by replicas
+#    For educational use only,
+#    Not for commercial use
+
+import operator
+import os
+import struct
+import zlib
+
+from d_graph import DirectedGraph
+from ud_graph import UndirectedGraph
+
+# File layout (little-endian):
+#    header -> magic, reserved, generation
+#    frames -> payload size, record count, CRC-32 of payload, payload
+# Each record is an op code followed by its arguments as varints:
+#    directed   -> vertex indices as zigzag deltas (src from previous
+#                  record's src, dst from src), weight as zigzag int,
+#                  or -1 (never a valid weight) followed by a double
+#                  for weights that are not ints
+#    undirected -> vertex names as index into the frame's name table,
+#                  or 0 followed by length and UTF-8 bytes of a new name
+# Delta state and name table restart with every frame, so replicas
+# can start reading at any frame boundary
+# Compaction rewrites the log as the records of the current graph
+# state under the next generation number
+DIRECTED_LOG_MAGIC = b'DLG1'
+UNDIRECTED_LOG_MAGIC = b'ULG1'
+HEADER = struct.Struct('<4sIQ')
+FRAME = struct.Struct('<III')
+FLOAT_WEIGHT = struct.Struct('<d')
+OPS = ('add_vertex', 'add_edge', 'remove_edge', 'remove_vertex', 'compact')
+OP_CODES = {op: code for code, op in enumerate(OPS)}
+
+
+def _put_uint(out: bytearray, n: int) -> None:
+    """
+    Append unsigned int as LEB128 varint
+    """
+    while n > 0x7f:
+        out.append(n & 0x7f | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _put_int(out: bytearray, n: int) -> None:
+    """
+    Append signed int as zigzag varint, small magnitudes take one byte
+    """
+    _put_uint(out, n << 1 if n >= 0 else ~n << 1 | 1)
+
+
+def _put_weight(out: bytearray, weight) -> None:
+    """
+    Append edge weight, int weights keep their type on replay
+    """
+    try:
+        _put_int(out, operator.index(weight))
+    except TypeError:
+        data = FLOAT_WEIGHT.pack(float(weight))
+        _put_int(out, -1)
+        out += data
+
+
+def _get_uint(buf, pos: int) -> tuple:
+    """
+    Return (value, next position) of varint at pos
+    """
+    n = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        n |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _get_int(buf, pos: int) -> tuple:
+    """
+    Return (value, next position) of zigzag varint at pos
+    """
+    n, pos = _get_uint(buf, pos)
+    return (~(n >> 1) if n & 1 else n >> 1), pos
+
+
+def _state_edits(graph) -> list:
+    """
+    Return edits that rebuild graph from an empty graph
+    """
+    if isinstance(graph, DirectedGraph):
+        edits = [('add_vertex',)] * graph.v_count
+        edits.extend(('add_edge', src, dst, weight)
+                     for src, dst, weight in graph.iter_edges())
+        edits.extend(('remove_vertex', v) for v in sorted(graph._removed))
+    else:
+        edits = [('add_vertex', v) for v in graph.get_vertices()]
+        edits.extend(('add_edge', u, v) for u, v in graph.iter_edges())
+    return edits
+
+
+class ChangeLog:
+    """
+    Records every mutation of a graph as binary deltas in an
+    append-only file, see replay() for the reading side
+    """
+
+    # Pending records are written as a frame once they reach this size
+    FRAME_BYTES = 1 << 16
+
+    def __init__(self, graph, path):
+        """
+        Start log at path with the current state of graph and attach
+        it, so all further mutations are recorded
+        An existing log at path is replaced by the next generation
+        """
+        self.graph = graph
+        self.path = path
+        self.directed = isinstance(graph, DirectedGraph)
+        self.generation = 0
+        try:
+            with open(path, 'rb') as f:
+                self.generation = _read_header(f, path)[1] + 1
+        except (OSError, ValueError):
+            pass
+        self._file = None
+        with graph._lock:
+            self._rewrite()
+            graph._log = self
+
+    def record(self, edit: tuple) -> None:
+        """
+        Append one edit, tuple of method name and arguments
+        """
+        out = self._frame
+        op = edit[0]
+        out.append(OP_CODES[op])
+        if self.directed:
+            if op == 'add_vertex' or op == 'compact':
+                pass
+            elif op == 'remove_vertex':
+                _put_int(out, edit[1] - self._last)
+                self._last = edit[1]
+            else:
+                src, dst = edit[1], edit[2]
+                _put_int(out, src - self._last)
+                _put_int(out, dst - src)
+                self._last = src
+                if op == 'add_edge':
+                    _put_weight(out, edit[3] if len(edit) > 3 else 1)
+        else:
+            for name in edit[1:]:
+                index = self._names.get(name)
+                if index is not None:
+                    _put_uint(out, index)
+                    continue
+                self._names[name] = len(self._names) + 1
+                data = name.encode('utf-8')
+                out.append(0)
+                _put_uint(out, len(data))
+                out += data
+        self._count += 1
+        if len(out) >= self.FRAME_BYTES:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Write pending records as one frame, returns log size in bytes
+        Replicas only see records that were flushed
+        """
+        with self.graph._lock:
+            if self._count:
+                payload = bytes(self._frame)
+                self._file.write(FRAME.pack(len(payload), self._count,
+                                            zlib.crc32(payload)))
+                self._file.write(payload)
+                self._start_frame()
+            self._file.flush()
+            return self._file.tell()
+
+    def compact(self) -> int:
+        """
+        Fold log into the records of the current graph state under the
+        next generation, replicas then rebuild on their next replay()
+        Returns log size in bytes
+        """
+        with self.graph._lock:
+            self._file.close()
+            self.generation += 1
+            return self._rewrite()
+
+    def close(self) -> None:
+        """
+        Flush pending records and stop recording mutations
+        """
+        with self.graph._lock:
+            self.flush()
+            self._file.close()
+            self.graph._log = None
+
+    def _start_frame(self) -> None:
+        """
+        Clear pending records and delta state
+        """
+        self._frame = bytearray()
+        self._count = 0
+        self._last = 0
+        self._names = dict()
+
+    def _rewrite(self) -> int:
+        """
+        Write header and current graph state to a new file that
+        replaces the log in one step, so readers never see it partially
+        """
+        magic = DIRECTED_LOG_MAGIC if self.directed else UNDIRECTED_LOG_MAGIC
+        temp = f'{self.path}.tmp'
+        self._file = open(temp, 'wb')
+        self._file.write(HEADER.pack(magic, 0, self.generation))
+        self._start_frame()
+        for edit in _state_edits(self.graph):
+            self.record(edit)
+        size = self.flush()
+        self._file.close()
+        os.replace(temp, self.path)
+        self._file = open(self.path, 'ab')
+        return size
+
+
+def _read_header(f, path) -> tuple:
+    """
+    Return (magic, generation) of open log file
+    """
+    data = f.read(HEADER.size)
+    if len(data) < HEADER.size:
+        raise ValueError(f'{path} is not a graph log')
+    magic, _, generation = HEADER.unpack(data)
+    if magic not in (DIRECTED_LOG_MAGIC, UNDIRECTED_LOG_MAGIC):
+        raise ValueError(f'{path} is not a graph log')
+    return magic, generation
+
+
+def _get_weight(buf, pos: int) -> tuple:
+    """
+    Return (weight, next position) of edge weight at pos
+    """
+    weight, pos = _get_int(buf, pos)
+    if weight == -1:
+        weight = FLOAT_WEIGHT.unpack_from(buf, pos)[0]
+        pos += FLOAT_WEIGHT.size
+    return weight, pos
+
+
+def _decode_frame(payload, count: int, directed: bool) -> list:
+    """
+    Return list of edits stored in frame payload
+    """
+    edits = []
+    pos = 0
+    last = 0
+    names = [None]
+    for _ in range(count):
+        op = OPS[payload[pos]]
+        pos += 1
+        if directed:
+            if op == 'add_vertex' or op == 'compact':
+                edits.append((op,))
+            elif op == 'remove_vertex':
+                delta, pos = _get_int(payload, pos)
+                last += delta
+                edits.append((op, last))
+            else:
+                delta, pos = _get_int(payload, pos)
+                last += delta
+                delta, pos = _get_int(payload, pos)
+                if op == 'add_edge':
+                    weight, pos = _get_weight(payload, pos)
+                    edits.append((op, last, last + delta, weight))
+                else:
+                    edits.append((op, last, last + delta))
+        else:
+            args = []
+            for _ in range(1 if op.endswith('vertex') else 2):
+                index, pos = _get_uint(payload, pos)
+                if index == 0:
+                    size, pos = _get_uint(payload, pos)
+                    names.append(bytes(payload[pos:pos + size])
+                                  .decode('utf-8'))
+                    pos += size
+                    index = len(names) - 1
+                args.append(names[index])
+            edits.append((op, *args))
+    return edits
+
+
+def replay(path, graph=None, position=None, storage='dense') -> tuple:
+    """
+    Bring replica up to date with log at path, returns (graph, position)
+    Pass both back in on the next call so only new frames are read
+    A new graph (with given storage if directed) is built when graph
+    is None or the log was compacted since position
+    """
+    with open(path, 'rb') as f:
+        magic, generation = _read_header(f, path)
+        directed = magic == DIRECTED_LOG_MAGIC
+        if graph is None or position is None or position[0] != generation:
+            graph = DirectedGraph(storage=storage) if directed \
+                else UndirectedGraph()
+            offset = HEADER.size
+        else:
+            offset = position[1]
+            f.seek(offset)
+        data = memoryview(f.read())
+
+    # Frames are applied in batches, split where the primary compacted
+    edits = []
+    pos = 0
+    while pos + FRAME.size <= len(data):
+        size, count, crc = FRAME.unpack_from(data, pos)
+        payload = data[pos + FRAME.size:pos + FRAME.size + size]
+        # Frame still being written by the primary
+        if len(payload) < size:
+            break
+        if zlib.crc32(payload) != crc:
+            raise ValueError(f'{path} is corrupt at offset {offset + pos}')
+        for edit in _decode_frame(payload, count, directed):
+            if edit[0] == 'compact':
+                graph.apply_edits(edits)
+                graph.compact()
+                edits = []
+            else:
+                edits.append(edit)
+        pos += FRAME.size + size
+    graph.apply_edits(edits)
+    return graph, (generation, offset + pos)
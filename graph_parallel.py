@@ -0,0 +1,94 @@
+# Author: Philip Beck
+# Email: stoneroll6@gmail.com
+# Date: 1/17/2021
+# Description:
+#    Parallel batch queries for DirectedGraph,
+#    workers share one read-only copy of the graph
+#    For educational use only,
+#    Not for commercial use
+
+import multiprocessing
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from graph_io import load_graph, save_graph
+
+# RAM-backed directory for the shared graph file, if the OS has one
+SHARED_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+# Graph mapped by each worker process, set by _init_worker()
+_worker_graph = None
+
+
+def _free_threaded() -> bool:
+    """
+    Return True on CPython builds running without the GIL
+    """
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+def _init_worker(path) -> None:
+    """
+    Map shared graph file once per worker process
+    """
+    global _worker_graph
+    _worker_graph = load_graph(path, mmap=True)
+
+
+def _dijkstra_chunk(sources) -> list:
+    """
+    Run dijkstra for chunk of sources on worker graph
+    """
+    return [(src, _worker_graph.dijkstra(src)) for src in sources]
+
+
+def iter_dijkstra(graph, sources=None, workers=None, chunk_size=16):
+    """
+    Yield (src, distances) for each source in order, running dijkstra
+    on a pool of workers (defaults to all sources and all cores)
+    Processes map the graph from one shared file instead of receiving
+    a pickled copy, free-threaded builds use threads on the graph itself
+    """
+    if sources is None:
+        sources = range(graph.v_count)
+    sources = list(sources)
+    chunks = [sources[i:i + chunk_size]
+              for i in range(0, len(sources), chunk_size)]
+    workers = workers or os.cpu_count() or 1
+
+    # Not worth starting a pool for a single worker or chunk
+    if workers == 1 or len(chunks) <= 1:
+        for src in sources:
+            yield src, graph.dijkstra(src)
+        return
+
+    if _free_threaded():
+        # Threads share one consistent read-only copy of the graph
+        view = graph.snapshot()
+
+        def run(chunk):
+            return [(src, view.dijkstra(src)) for src in chunk]
+        with ThreadPoolExecutor(workers) as pool:
+            for rows in pool.map(run, chunks):
+                yield from rows
+        return
+
+    fd, path = tempfile.mkstemp(suffix='.graph', dir=SHARED_DIR)
+    os.close(fd)
+    try:
+        save_graph(graph, path)
+        with multiprocessing.Pool(workers, _init_worker, (path,)) as pool:
+            for rows in pool.imap(_dijkstra_chunk, chunks):
+                yield from rows
+    finally:
+        os.remove(path)
+
+
+def distance_matrix(graph, sources=None, workers=None) -> list:
+    """
+    Return list of dijkstra() distance rows, one per source
+    """
+    return [row for _, row in iter_dijkstra(graph, sources, workers)]
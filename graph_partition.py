@@ -0,0 +1,668 @@
+# Author: Philip Beck
+# Email: stoneroll6@gmail.com
+# Date: 1/17/2021
+# Description:
+#    Partitioned DirectedGraph and UndirectedGraph,
+#    BFS, SSSP and connected components run as
+#    supersteps across one worker process per shard
+#    For educational use only,
+#    Not for commercial use
+
+import heapq
+import mmap as mmap_module
+import multiprocessing
+import os
+import struct
+import tempfile
+import weakref
+from array import array
+from collections import deque
+from itertools import chain
+
+from d_graph import DirectedGraph
+from graph_parallel import SHARED_DIR
+
+# Shard file layout (native byte order, files never leave the machine):
+#    array count, then typecode and length of each array,
+#    then the arrays, each padded to 8 bytes
+# Every shard holds the out-edges of the vertices it owns, including
+# boundary edges whose target is owned by another shard; state of such
+# ghost targets lives only at their owner and is updated by messages
+# Directed shards also hold in-edges, for weakly connected components
+ARRAY_COUNT = struct.Struct('<I')
+ARRAY_ENTRY = struct.Struct('<cQ')
+
+
+def _save_arrays(path, arrays) -> None:
+    """
+    Write list of arrays to file
+    """
+    with open(path, 'wb') as f:
+        f.write(ARRAY_COUNT.pack(len(arrays)))
+        for a in arrays:
+            f.write(ARRAY_ENTRY.pack(a.typecode.encode(), len(a)))
+        f.write(b'\0' * (-f.tell() % 8))
+        for a in arrays:
+            f.write(a)
+            f.write(b'\0' * (-f.tell() % 8))
+
+
+def _load_arrays(path) -> list:
+    """
+    Map file written by _save_arrays(), returns list of typed views
+    """
+    with open(path, 'rb') as f:
+        buf = mmap_module.mmap(f.fileno(), 0, access=mmap_module.ACCESS_READ)
+    view = memoryview(buf)
+    count, = ARRAY_COUNT.unpack_from(view)
+    entries = [ARRAY_ENTRY.unpack_from(view, ARRAY_COUNT.size + i *
+                                       ARRAY_ENTRY.size)
+               for i in range(count)]
+    pos = ARRAY_COUNT.size + count * ARRAY_ENTRY.size
+    pos += -pos % 8
+    arrays = []
+    for typecode, length in entries:
+        typecode = typecode.decode()
+        size = array(typecode).itemsize * length
+        arrays.append(view[pos:pos + size].cast(typecode))
+        pos += size + -size % 8
+    return arrays
+
+
+def _find(parent: dict, label: int) -> int:
+    """
+    Return root label of label's set, compressing the path to it
+    """
+    root = label
+    while parent.get(root, root) != root:
+        root = parent[root]
+    while label != root:
+        parent[label], label = root, parent[label]
+    return root
+
+
+def _union(parent: dict, first, second) -> None:
+    """
+    Merge sets of labels paired by index in first and second,
+    the smallest label of every set is its root
+    """
+    for a, b in zip(first, second):
+        a, b = _find(parent, a), _find(parent, b)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+
+
+class _Shard:
+    """
+    Vertices of one partition with their edges, runs one superstep
+    of a partitioned algorithm per call
+    Steps return (messages, pending): messages are (targets, values)
+    arrays, one pair per shard, and pending is the work the shard kept
+    for later steps
+    """
+
+    def __init__(self, index: int, shard_count: int, arrays, owner, local):
+        self.index = index
+        self.shard_count = shard_count
+        (self.vertices, self.offsets, self.targets, self.weights,
+         self.in_offsets, self.in_targets) = arrays
+        # Owning shard and index within it of every vertex
+        self.owner = owner
+        self.local = local
+        self.kind = None
+        self.values = None
+        self._next = []
+        self._heap = []
+        # Local component of every vertex, label (smallest vertex
+        # index) and boundary edge targets of every local component
+        self._comp = None
+        self._comp_label = None
+        self._boundary = None
+
+    def reset(self, kind: str) -> None:
+        """
+        Initialize per-vertex state for algorithm kind
+        """
+        n = len(self.vertices)
+        self.kind = kind
+        if kind == 'bfs':
+            self.values = array('q', [-1]) * n
+        elif kind == 'sssp':
+            self.values = array('d', [float('inf')]) * n
+        self._next = []
+        self._heap = []
+
+    def result(self):
+        """
+        Return state of owned vertices, in self.vertices order
+        """
+        if self.kind == 'cc':
+            labels = self._comp_label
+            return array('q', [labels[c] for c in self._comp])
+        return self.values
+
+    def bfs_step(self, depth: int, targets, _) -> tuple:
+        """
+        Mark vertices reached at depth and send their neighbors
+        to the owning shards, returns (messages, pending) where pending
+        counts neighbors this shard keeps for the next level
+        """
+        levels, local, owner = self.values, self.local, self.owner
+        offsets, edge_targets = self.offsets, self.targets
+        frontier = []
+        for t in chain(targets, self._next):
+            i = local[t]
+            if levels[i] < 0:
+                levels[i] = depth
+                frontier.append(i)
+
+        boxes = [set() for _ in range(self.shard_count)]
+        for i in frontier:
+            for k in range(offsets[i], offsets[i + 1]):
+                t = edge_targets[k]
+                boxes[owner[t]].add(t)
+        # Neighbors owned here never leave the shard
+        own, boxes[self.index] = boxes[self.index], ()
+        self._next = [t for t in own if levels[local[t]] < 0]
+        return [(array('i', box), None) for box in boxes], len(self._next)
+
+    def sssp_step(self, bound, targets, values) -> tuple:
+        """
+        Lower distances of vertices from messages, then run Dijkstra
+        inside the shard on vertices up to bound (delta-stepping), so
+        few distances are corrected by later messages; boundary edges
+        become messages with the smallest distance per target, pending
+        is the smallest distance still queued (inf if none)
+        """
+        dist, local, owner = self.values, self.local, self.owner
+        offsets, edge_targets, weights = \
+            self.offsets, self.targets, self.weights
+        heap = self._heap
+        for t, d in zip(targets, values):
+            i = local[t]
+            if d < dist[i]:
+                dist[i] = d
+                heapq.heappush(heap, (d, i))
+
+        boxes = [dict() for _ in range(self.shard_count)]
+        inf = float('inf')
+        while heap and heap[0][0] <= bound:
+            d, i = heapq.heappop(heap)
+            if d > dist[i]:
+                continue
+            for k in range(offsets[i], offsets[i + 1]):
+                t = edge_targets[k]
+                new = d + weights[k]
+                o = owner[t]
+                if o == self.index:
+                    j = local[t]
+                    if new < dist[j]:
+                        dist[j] = new
+                        heapq.heappush(heap, (new, j))
+                elif new < boxes[o].get(t, inf):
+                    boxes[o][t] = new
+        return [(array('i', box), array('d', box.values()))
+                for box in boxes], heap[0][0] if heap else inf
+
+    def cc_local(self) -> list:
+        """
+        Label components formed by edges inside the shard, returns
+        messages telling the owner of every boundary edge target the
+        label of the component on this side
+        """
+        self._cc_local()
+        boxes = [set() for _ in range(self.shard_count)]
+        for label, remote in zip(self._comp_label, self._boundary):
+            for t in remote:
+                boxes[self.owner[t]].add((t, label))
+        return [(array('i', [t for t, _ in box]),
+                 array('q', [label for _, label in box]))
+                for box in boxes]
+
+    def cc_pairs(self, targets, values) -> tuple:
+        """
+        Returns (labels, roots) arrays joining local components of
+        this and other shards, reduced to a spanning forest of the
+        components joined by messages from cc_local()
+        """
+        comp, labels, local = self._comp, self._comp_label, self.local
+        parent = dict()
+        _union(parent, values, [labels[comp[local[t]]] for t in targets])
+        return (array('q', parent),
+                array('q', [_find(parent, label) for label in parent]))
+
+    def cc_relabel(self, labels, roots) -> None:
+        """
+        Replace labels of local components joined across shards
+        """
+        index = {label: c for c, label in enumerate(self._comp_label)}
+        for label, root in zip(labels, roots):
+            self._comp_label[index[label]] = root
+
+    def _cc_local(self) -> None:
+        """
+        Label components formed by edges inside the shard, vertices
+        are in ascending order so each root is its smallest vertex
+        """
+        owner, local = self.owner, self.local
+        edges = [(self.offsets, self.targets)]
+        if len(self.in_offsets):
+            edges.append((self.in_offsets, self.in_targets))
+        comp = array('i', [-1]) * len(self.vertices)
+        labels = array('q')
+        boundary = []
+        for root in range(len(comp)):
+            if comp[root] >= 0:
+                continue
+            c = len(labels)
+            labels.append(self.vertices[root])
+            remote = []
+            boundary.append(remote)
+            comp[root] = c
+            stack = [root]
+            while stack:
+                i = stack.pop()
+                for offsets, edge_targets in edges:
+                    for k in range(offsets[i], offsets[i + 1]):
+                        t = edge_targets[k]
+                        if owner[t] != self.index:
+                            remote.append(t)
+                            continue
+                        j = local[t]
+                        if comp[j] < 0:
+                            comp[j] = c
+                            stack.append(j)
+        self._comp, self._comp_label, self._boundary = comp, labels, boundary
+
+
+def _shard_main(conn, index, shard_count, path, index_path) -> None:
+    """
+    Worker process loop, maps its shard once and runs the
+    (method, args) calls received on conn until None arrives
+    """
+    shard = _Shard(index, shard_count, _load_arrays(path),
+                   *_load_arrays(index_path))
+    while True:
+        message = conn.recv()
+        if message is None:
+            return
+        method, args = message
+        try:
+            conn.send((True, getattr(shard, method)(*args)))
+        except Exception as error:
+            conn.send((False, error))
+
+
+def _release(workers: list, paths: list) -> None:
+    """
+    Stop worker processes and remove shard files, runs once per
+    PartitionedGraph, from close() or when it is garbage collected
+    """
+    for conn, process in workers:
+        try:
+            conn.send(None)
+        except OSError:
+            # Worker already exited
+            pass
+        process.join()
+    workers.clear()
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    paths.clear()
+
+
+class PartitionedGraph:
+    """
+    Vertices of a DirectedGraph or UndirectedGraph split across shards,
+    each served by its own worker process; whole-graph passes run as
+    supersteps with frontier exchange between shards in between
+    Results use vertex indices for directed graphs and vertex names
+    for undirected graphs
+    """
+
+    PARTITIONERS = ('hash', 'bfs')
+
+    def __init__(self, graph, shards=None, partitioner='hash'):
+        """
+        Split graph into shards (one per core by default), by hashing
+        vertex indices or by cutting a BFS order of the vertices into
+        equal ranges, which keeps neighbors together (fewer boundary
+        edges and messages)
+        """
+        if partitioner not in self.PARTITIONERS:
+            raise ValueError(f'Unknown partitioner: {partitioner!r}')
+        self.directed = isinstance(graph, DirectedGraph)
+        if self.directed:
+            offsets, targets, weights = graph.to_csr()
+            self.names = None
+            self._removed = set(graph._removed)
+        else:
+            self.names = graph.get_vertices()
+            ids = {name: i for i, name in enumerate(self.names)}
+            offsets = array('q', [0])
+            targets = array('i')
+            for name in self.names:
+                targets.extend(ids[v] for v in graph.adj_list[name])
+                offsets.append(len(targets))
+            weights = array('q', [1]) * len(targets)
+            self._ids = ids
+            self._removed = set()
+        self.v_count = len(offsets) - 1
+        # SSSP settles one mean edge weight of distances per step
+        self._delta = sum(weights) / len(weights) if len(weights) else 1
+        # Distances are computed as floats, int weights give int results
+        self._int_weights = weights.typecode == 'q'
+        self.shard_count = max(1, min(shards or os.cpu_count() or 1,
+                                      self.v_count))
+
+        if partitioner == 'hash':
+            # Multiplicative hash scatters runs of neighboring indices
+            owner = array('i', [(v * 2654435761 & 0xffffffff)
+                                % self.shard_count
+                                for v in range(self.v_count)])
+        else:
+            owner = self._bfs_owner(offsets, targets)
+        local = array('i', [0]) * self.v_count
+        members = [array('i') for _ in range(self.shard_count)]
+        for v in range(self.v_count):
+            shard = members[owner[v]]
+            local[v] = len(shard)
+            shard.append(v)
+        # Boundary edges, each undirected edge is stored twice
+        self.cut_edges = sum(owner[targets[k]] != owner[v]
+                             for v in range(self.v_count)
+                             for k in range(offsets[v], offsets[v + 1]))
+        if not self.directed:
+            self.cut_edges //= 2
+
+        in_csr = self._reverse(offsets, targets) if self.directed else None
+        shards = [self._shard_arrays(vertices, (offsets, targets, weights),
+                                     in_csr)
+                  for vertices in members]
+        self._members = members
+        self._owner = owner
+        self._workers = []
+        self._paths = []
+        # Holds the lists, not self, so dropped graphs are still released
+        self._finalizer = weakref.finalize(self, _release, self._workers,
+                                           self._paths)
+        if self.shard_count == 1:
+            # Not worth starting a process for a single shard
+            self._local = _Shard(0, 1, shards[0], owner, local)
+            return
+        self._local = None
+        for arrays in [(owner, local)] + shards:
+            fd, path = tempfile.mkstemp(suffix='.shard', dir=SHARED_DIR)
+            os.close(fd)
+            _save_arrays(path, list(arrays))
+            self._paths.append(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        """
+        Stop worker processes and remove shard files, also done when
+        the graph is garbage collected or the interpreter exits
+        """
+        self._finalizer()
+
+    def bfs_levels(self, v_start):
+        """
+        Returns hop counts from v_start found by level-synchronous BFS,
+        -1 for unreachable vertices
+        """
+        src = self._index(v_start)
+        if src is None:
+            return self._output([-1] * self.v_count)
+        return self._output(self._run('bfs', src))
+
+    def distances(self, src):
+        """
+        Returns shortest path lengths from src like dijkstra(),
+        float('inf') for unreachable vertices
+        Shards settle one band of distances per step (delta-stepping)
+        """
+        i = self._index(src)
+        if i is None:
+            return self._output([float('inf')] * self.v_count)
+        values = self._run('sssp', i)
+        if self._int_weights:
+            values = [int(d) if d != float('inf') else d for d in values]
+        return self._output(values)
+
+    def connected_components(self):
+        """
+        Returns label of the (weakly) connected component of every
+        vertex, its smallest vertex index (or the name of that vertex)
+        """
+        labels = self._components()
+        if self.names is not None:
+            labels = [self.names[label] for label in labels]
+        return self._output(labels)
+
+    def count_connected_components(self) -> int:
+        """
+        Returns number of (weakly) connected components
+        """
+        labels = self._components()
+        return len({label for v, label in enumerate(labels)
+                    if v not in self._removed})
+
+    def _index(self, v):
+        """
+        Returns vertex index of v, None if v is not a vertex
+        """
+        if self.names is not None:
+            return self._ids.get(v)
+        if isinstance(v, int) and 0 <= v < self.v_count \
+                and v not in self._removed:
+            return v
+        return None
+
+    def _output(self, values):
+        """
+        Returns per-vertex values as list, or as dict by vertex name
+        """
+        if self.names is None:
+            return values
+        return dict(zip(self.names, values))
+
+    def _run(self, kind: str, src=None) -> list:
+        """
+        Run supersteps of algorithm kind until no shard has messages
+        left, returns per-vertex results
+        """
+        self._call('reset', [(kind,)] * self.shard_count)
+        inboxes = [[] for _ in range(self.shard_count)]
+        if src is not None:
+            inboxes[self._owner[src]].append(
+                (array('i', [src]),
+                 array('d' if kind == 'sssp' else 'q', [0])))
+        # Step number, or for SSSP the distance up to which vertices
+        # are settled, one delta beyond the closest unsettled vertex
+        step = self._delta if kind == 'sssp' else 0
+        while True:
+            calls = []
+            for inbox in inboxes:
+                targets = array('i')
+                values = array('d' if kind == 'sssp' else 'q')
+                for box_targets, box_values in inbox:
+                    targets.extend(box_targets)
+                    if box_values is not None:
+                        values.extend(box_values)
+                calls.append((step, targets, values))
+            results = self._call(f'{kind}_step', calls)
+
+            # Route messages to their shards for the next superstep
+            inboxes = [[] for _ in range(self.shard_count)]
+            pending = 0
+            closest = float('inf')
+            for boxes, kept in results:
+                if kind == 'sssp':
+                    closest = min(closest, kept)
+                else:
+                    pending += kept
+                for shard, box in enumerate(boxes):
+                    if len(box[0]):
+                        inboxes[shard].append(box)
+                        pending += len(box[0])
+                        if kind == 'sssp':
+                            closest = min(closest, min(box[1]))
+            if kind == 'sssp':
+                if closest == float('inf'):
+                    break
+                step = closest + self._delta
+            elif not pending:
+                break
+            else:
+                step += 1
+
+        return self._gather()
+
+    def _components(self) -> list:
+        """
+        Label every vertex with the smallest vertex of its (weakly)
+        connected component: shards label their local components,
+        boundary edges give pairs of joined local components, and a
+        union-find over the pairs (at most one per boundary edge)
+        merges them, independent of the graph diameter
+        """
+        self._call('reset', [('cc',)] * self.shard_count)
+        inboxes = [[] for _ in range(self.shard_count)]
+        for boxes in self._call('cc_local', [()] * self.shard_count):
+            for shard, box in enumerate(boxes):
+                inboxes[shard].append(box)
+        calls = []
+        for inbox in inboxes:
+            targets, values = array('i'), array('q')
+            for box_targets, box_values in inbox:
+                targets.extend(box_targets)
+                values.extend(box_values)
+            calls.append((targets, values))
+
+        parent = dict()
+        for first, second in self._call('cc_pairs', calls):
+            _union(parent, first, second)
+
+        # Labels are vertices, so each belongs to the shard owning it
+        relabel = [(array('q'), array('q')) for _ in range(self.shard_count)]
+        for label in parent:
+            labels, roots = relabel[self._owner[label]]
+            labels.append(label)
+            roots.append(_find(parent, label))
+        self._call('cc_relabel', relabel)
+
+        return self._gather()
+
+    def _gather(self) -> list:
+        """
+        Returns per-vertex results of all shards by vertex index
+        """
+        values = [None] * self.v_count
+        results = self._call('result', [()] * self.shard_count)
+        for vertices, result in zip(self._members, results):
+            for v, value in zip(vertices, result):
+                values[v] = value
+        return values
+
+    def _call(self, method: str, args: list) -> list:
+        """
+        Call method on every shard with its arguments, shards run in
+        parallel and results are returned in shard order
+        """
+        if self._local is not None:
+            return [getattr(self._local, method)(*args[0])]
+        if not self._workers:
+            self._start()
+        for (conn, _), shard_args in zip(self._workers, args):
+            conn.send((method, shard_args))
+        results = [conn.recv() for conn, _ in self._workers]
+        for ok, result in results:
+            if not ok:
+                raise result
+        return [result for _, result in results]
+
+    def _start(self) -> None:
+        """
+        Start one worker process per shard
+        """
+        for index in range(self.shard_count):
+            conn, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_shard_main, daemon=True,
+                args=(child, index, self.shard_count,
+                      self._paths[index + 1], self._paths[0]))
+            process.start()
+            self._workers.append((conn, process))
+
+    def _bfs_owner(self, offsets, targets):
+        """
+        Returns owner array cutting BFS order of all vertices into
+        shard_count ranges of equal size
+        """
+        seen = bytearray(self.v_count)
+        order = []
+        for root in range(self.v_count):
+            if seen[root]:
+                continue
+            seen[root] = 1
+            queue = deque([root])
+            while queue:
+                v = queue.popleft()
+                order.append(v)
+                for k in range(offsets[v], offsets[v + 1]):
+                    t = targets[k]
+                    if not seen[t]:
+                        seen[t] = 1
+                        queue.append(t)
+        owner = array('i', [0]) * self.v_count
+        size = -(-self.v_count // self.shard_count)
+        for position, v in enumerate(order):
+            owner[v] = position // size
+        return owner
+
+    def _reverse(self, offsets, targets) -> tuple:
+        """
+        Returns (offsets, sources) arrays of incoming edges
+        """
+        counts = array('q', [0]) * (self.v_count + 1)
+        for t in targets:
+            counts[t + 1] += 1
+        for v in range(self.v_count):
+            counts[v + 1] += counts[v]
+        fill = array('q', counts)
+        sources = array('i', [0]) * len(targets)
+        for v in range(self.v_count):
+            for k in range(offsets[v], offsets[v + 1]):
+                t = targets[k]
+                sources[fill[t]] = v
+                fill[t] += 1
+        return counts, sources
+
+    def _shard_arrays(self, vertices, csr, in_csr) -> tuple:
+        """
+        Returns edge arrays of one shard, rows in vertices order
+        """
+        offsets, targets, weights = csr
+        shard = (vertices, array('q', [0]), array('i'),
+                 array(weights.typecode), array('q', [0]), array('i'))
+        for v in vertices:
+            start, end = offsets[v], offsets[v + 1]
+            shard[2].extend(targets[start:end])
+            shard[3].extend(weights[start:end])
+            shard[1].append(len(shard[2]))
+            if in_csr is not None:
+                in_offsets, sources = in_csr
+                shard[5].extend(sources[in_offsets[v]:in_offsets[v + 1]])
+                shard[4].append(len(shard[5]))
+        if in_csr is None:
+            # Undirected edges are stored in both directions already
+            shard[4].pop()
+        return shard
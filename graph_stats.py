@@ -0,0 +1,111 @@
+# Author: Philip Beck
+# Email: stoneroll6@gmail.com
+# Date: 1/17/2021
+# Description:
+#    Opt-in instrumentation for DirectedGraph
+#    and UndirectedGraph methods
+#    For educational use only,
+#    Not for commercial use
+
+from collections import defaultdict
+from functools import wraps
+from threading import get_ident
+from time import perf_counter
+
+
+class GraphStats:
+    """
+    Collects per-method call counts and cumulative time, plus
+    algorithm counters (vertices popped, edges relaxed, ...) and
+    high-water marks of stacks, queues and heaps
+    """
+
+    def __init__(self, callback=None):
+        """
+        callback(method, seconds) is called after every instrumented call
+        """
+        self.callback = callback
+        # Threads inside a timed call, calls they make are not timed
+        self.active = set()
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Clear all collected values
+        """
+        self.calls = defaultdict(int)
+        self.seconds = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.high_water = defaultdict(int)
+
+    def record_call(self, method: str, seconds: float) -> None:
+        """
+        Add one timed call of method
+        """
+        self.calls[method] += 1
+        self.seconds[method] += seconds
+        if self.callback is not None:
+            self.callback(method, seconds)
+
+    def begin(self) -> bool:
+        """
+        Mark calling thread as inside a timed call, returns False if
+        it already is (nested call, timed as part of the outer one)
+        """
+        thread = get_ident()
+        if thread in self.active:
+            return False
+        self.active.add(thread)
+        return True
+
+    def end(self, method: str, start: float) -> None:
+        """
+        Record call of method begun at perf_counter() value start
+        """
+        self.active.discard(get_ident())
+        self.record_call(method, perf_counter() - start)
+
+    def count(self, name: str, amount=1) -> None:
+        """
+        Increase algorithm counter
+        """
+        self.counters[name] += amount
+
+    def mark(self, name: str, size: int) -> None:
+        """
+        Raise high-water mark of name to size if larger
+        """
+        if size > self.high_water[name]:
+            self.high_water[name] = size
+
+    def as_dict(self) -> dict:
+        """
+        Return snapshot of all values as plain dictionaries
+        """
+        return {
+            'calls': dict(self.calls),
+            'seconds': dict(self.seconds),
+            'counters': dict(self.counters),
+            'high_water': dict(self.high_water),
+        }
+
+
+def instrumented(method):
+    """
+    Decorator timing method calls when graph.stats is enabled,
+    costs one attribute check per call when disabled
+    Calls made by another timed method are not recorded again
+    """
+    name = method.__name__
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        stats = self.stats
+        if stats is None or not stats.begin():
+            return method(self, *args, **kwargs)
+        start = perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            stats.end(name, start)
+    return wrapper
@@ -0,0 +1,64 @@
+# Author: Philip Beck
+# Email: stoneroll6@gmail.com
+# Date: 1/17/2021
+# Description:
+#    Opt-in write lock for DirectedGraph and UndirectedGraph
+#    mutations, readers use lock-free snapshots
+#    For educational use only,
+#    Not for commercial use
+
+import threading
+from functools import wraps
+from time import perf_counter
+
+
+class _NoLock:
+    """
+    Stand-in for the graph lock while concurrency is off,
+    entering and leaving it does nothing
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NO_LOCK = _NoLock()
+
+
+def make_lock(concurrent: bool):
+    """
+    Return new graph lock, a real one only if concurrent is True
+    """
+    return threading.RLock() if concurrent else NO_LOCK
+
+
+def synchronized(method):
+    """
+    Decorator for mutating methods, runs method while holding
+    graph._lock, so writers and snapshot() never see a half-applied
+    mutation, and times it like graph_stats.instrumented()
+    Both are done in one wrapper: without concurrency (see
+    enable_concurrency()) and stats a call only costs two checks
+    """
+    name = method.__name__
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        lock, stats = self._lock, self.stats
+        if stats is None or not stats.begin():
+            if lock is NO_LOCK:
+                return method(self, *args, **kwargs)
+            with lock:
+                return method(self, *args, **kwargs)
+        start = perf_counter()
+        try:
+            with lock:
+                return method(self, *args, **kwargs)
+        finally:
+            stats.end(name, start)
+    return wrapper
@@ -0,0 +1,101 @@
+# Author: Philip Beck
+# Email: stoneroll6@gmail.com
+# Date: 1/17/2021
+# Description:
+#    Shared traversal core for DirectedGraph
+#    and UndirectedGraph
+#    For educational use only,
+#    Not for commercial use
+
+from collections import deque
+
+
+def iter_dfs(v_start, adjacent, details=False, stats=None):
+    """
+    Yields vertices in depth-first order as they are visited,
+    adjacent(v) returns neighbors of v in the order they are picked
+    If details is True, yields (vertex, depth, parent) tuples
+    Pops and stack size are recorded in stats (GraphStats) if given
+    """
+    visited = set()
+    stack = [(v_start, 0, None)]
+
+    # Stack goes as deep as possible, then back-tracks
+    while stack:
+        if stats is not None:
+            stats.count('dfs.vertices_popped')
+            stats.mark('dfs.stack', len(stack))
+        v, depth, parent = stack.pop()
+        if v in visited:
+            continue
+        visited.add(v)
+        yield (v, depth, parent) if details else v
+        # Push in reverse so first neighbor is popped first
+        for neighbor in reversed(adjacent(v)):
+            if neighbor not in visited:
+                stack.append((neighbor, depth + 1, v))
+
+
+def iter_bfs(v_start, adjacent, details=False, stats=None):
+    """
+    Yields vertices in breadth-first order as they are visited,
+    adjacent(v) returns neighbors of v in the order they are picked
+    If details is True, yields (vertex, depth, parent) tuples
+    Pops and queue size are recorded in stats (GraphStats) if given
+    """
+    visited = {v_start}
+    queue = deque([(v_start, 0, None)])
+
+    # Vertices are marked when queued so each is queued once
+    while queue:
+        if stats is not None:
+            stats.count('bfs.vertices_popped')
+            stats.mark('bfs.queue', len(queue))
+        v, depth, parent = queue.popleft()
+        yield (v, depth, parent) if details else v
+        for neighbor in adjacent(v):
+            if neighbor not in visited:
+                visited.add(neighbor)
+                queue.append((neighbor, depth + 1, v))
+
+
+def dfs_order(v_start, adjacent, v_end=None, stats=None) -> list:
+    """
+    Returns list of vertices visited during depth-first search,
+    search stops once v_end is visited
+    """
+    order = []
+    for v in iter_dfs(v_start, adjacent, stats=stats):
+        order.append(v)
+        if v == v_end:
+            break
+    return order
+
+
+def bfs_order(v_start, adjacent, v_end=None, stats=None) -> list:
+    """
+    Returns list of vertices visited during breadth-first search,
+    search stops once v_end is visited
+    """
+    order = []
+    for v in iter_bfs(v_start, adjacent, stats=stats):
+        order.append(v)
+        if v == v_end:
+            break
+    return order
+
+
+def join_paths(parents: tuple, meet) -> list:
+    """
+    Returns path through meeting vertex of a bidirectional search from
+    (forward, backward) parent dictionaries, where the parent of each
+    search's start vertex is None
+    """
+    forward, backward = parents
+    path = [meet]
+    while forward[path[-1]] is not None:
+        path.append(forward[path[-1]])
+    path.reverse()
+    while backward[path[-1]] is not None:
+        path.append(backward[path[-1]])
+    return path
@@ -7,6 +7,21 @@
 #    For educational use only,
 #    Not for commercial use
 
+from array import array
+from collections.abc import Mapping, Sequence
+
+from graph_async import (YIELD_EVERY, collect, drain, on_snapshot,
+                         run_steps)
+from graph_cache import ResultCache, cached
+from graph_stats import GraphStats, instrumented
+from graph_sync import NO_LOCK, make_lock, synchronized
+from graph_traversal import (bfs_order, dfs_order, iter_bfs, iter_dfs,
+                             join_paths)
+
+# Neighbor rows are compact arrays of vertex ids, rows growing past
+# this degree switch to dicts for O(1) membership checks and removal
+HUB_DEGREE = 512
+
 
 class UndirectedGraph:
     """
@@ -17,114 +32,412 @@ class UndirectedGraph:
     - Vertex names are strings
     """
 
+    __slots__ = (
+        '_ids', '_names', '_adj', '_free', '_sorted', 'stats', 'cache_size',
+        '_version', '_cache', '_cache_version',
+        '_cc_parent', '_cc_members', '_cc_dirty', '_cc_ghosts', '_cc_count',
+        '_lock', '_snapshot', '_log',
+    )
+
     def __init__(self, start_edges=None):
         """
-        Store graph info as adjacency list
+        Store graph info as adjacency list over interned vertex ids
         """
-        self.adj_list = dict()
+        # Vertex name -> id in insertion order, id -> name, id -> neighbor ids
+        self._ids = dict()
+        self._names = []
+        self._adj = []
+        # Ids of removed vertices, reused by new vertices
+        self._free = []
+        # Id -> neighbor ids sorted by name for traversals or None,
+        # filled on first visit and reset when the row changes
+        self._sorted = []
+        # GraphStats while instrumentation is enabled, None otherwise
+        self.stats = None
+        # Connected components index, built on first query (see _cc_build)
+        self._cc_parent = None
+        # Bumped by every mutation, cached results of older versions are stale
+        self._version = 0
+        # Items in cached query results per graph, 0 disables caching
+        self.cache_size = 1 << 16
+        self._cache = ResultCache()
+        self._cache_version = 0
+        # Held by mutations and snapshot(), readers never take it,
+        # no-op until enable_concurrency() is called
+        self._lock = NO_LOCK
+        # (version, read-only copy) returned by snapshot()
+        self._snapshot = None
+        # ChangeLog recording mutations (see graph_log), None if not logged
+        self._log = None
 
         # Populate graph with initial vertices and edges (if provided)
-        # Before using, implement add_vertex() and add_edge() methods
         if start_edges is not None:
-            for u, v in start_edges:
-                self.add_edge(u, v)
+            self._load_edges(start_edges)
+
+    @classmethod
+    def from_edge_array(cls, edges):
+        """
+        Build graph in one pass from array of (u, v) rows,
+        such as a NumPy array or list of pairs
+        Loops and duplicate edges are skipped
+        """
+        graph = cls()
+        graph._load_edges(edges)
+        return graph
+
+    @classmethod
+    def from_csr(cls, names, offsets, targets):
+        """
+        Wrap CSR arrays as read-only graph without copying them,
+        names is a sequence of vertex names in sorted order and the
+        neighbor ids of vertex i are targets[offsets[i]:offsets[i+1]]
+        """
+        graph = cls()
+        graph._names = names
+        graph._ids = SortedIndex(names)
+        graph._adj = CSRRows(offsets, targets)
+        return graph
+
+    def __getstate__(self) -> dict:
+        """
+        Return state for pickle and copy, leaving out the lock, caches,
+        snapshot and change log, which belong to this object only
+        Slots that were never set are left out too
+        """
+        state = {name: getattr(self, name) for name in self.__slots__
+                 if name not in ('_lock', '_cache', '_sorted', '_snapshot',
+                                 '_log')
+                 and hasattr(self, name)}
+        # Only whether concurrency is on is kept
+        state['_lock'] = self._lock is not NO_LOCK
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        """
+        Restore state from __getstate__() with a new lock, empty
+        caches, no snapshot and no change log
+        """
+        for name, value in state.items():
+            setattr(self, name, value)
+        self._lock = make_lock(state['_lock'])
+        self._cache = ResultCache()
+        self._sorted = []
+        self._snapshot = None
+        self._log = None
+
+    def snapshot(self):
+        """
+        Return read-only copy of the graph that is safe to query from
+        any number of threads while this graph keeps changing
+        Copy is shared until the next mutation
+        """
+        if isinstance(self._adj, CSRRows):
+            return self
+        with self._lock:
+            return drain(self._snapshot_steps())
+
+    def _snapshot_steps(self):
+        """
+        Step generator behind snapshot(), yields once per row copied
+        Rows are copied one at a time under the lock, so mutations can
+        run in between; the copy then starts over once, the second time
+        without yielding
+        """
+        if isinstance(self._adj, CSRRows):
+            return self
+        for _ in range(2):
+            version = self._version
+            if self._snapshot is not None and self._snapshot[0] == version:
+                return self._snapshot[1]
+            # Rows keep their ids and neighbor order, free ids stay empty
+            offsets = array('q', [0])
+            targets = array('i')
+            for i in range(len(self._adj)):
+                with self._lock:
+                    if self._version != version:
+                        break
+                    row = self._adj[i]
+                    if row is not None:
+                        targets.extend(row)
+                offsets.append(len(targets))
+                yield
+            with self._lock:
+                if self._version == version:
+                    graph = UndirectedGraph()
+                    graph._ids = dict(self._ids)
+                    graph._names = list(self._names)
+                    graph._adj = CSRRows(offsets, targets)
+                    graph.cache_size = self.cache_size
+                    self._snapshot = (version, graph)
+                    return graph
+        return self.snapshot()
+
+    @property
+    def adj_list(self):
+        """
+        Read-only {name: [neighbor names]} view of the graph
+        """
+        return AdjacencyView(self)
+
+    def _load_edges(self, edges) -> None:
+        """
+        Add many edges at once without per-edge bookkeeping
+        """
+        # NumPy arrays convert to nested lists far faster than row iteration
+        if hasattr(edges, 'tolist'):
+            edges = edges.tolist()
+
+        self._check_writable()
+        for u, v in edges:
+            if u == v:
+                continue
+            i, j = self._intern(u), self._intern(v)
+            if j not in self._adj[i]:
+                self._link(i, j)
+                self._link(j, i)
+        self._cc_parent = None
+        self._version += 1
 
     def __str__(self):
         """
         Return content of the graph in human-readable form
         """
-        out = [f'{v}: {self.adj_list[v]}' for v in self.adj_list]
+        out = [f'{v}: {self._neighbors(v)}' for v in self._ids]
         out = '\n  '.join(out)
         if len(out) < 70:
             out = out.replace('\n  ', ', ')
             return f'GRAPH: {{{out}}}'
         return f'GRAPH: {{\n  {out}}}'
 
+    @synchronized
     def add_vertex(self, v: str) -> None:
         """
         Add new vertex to the graph
         """
-        if v in self.adj_list.keys():
+        self._check_writable()
+        if v in self._ids:
             return
         else:
-            self.adj_list[v] = []
-        
+            self._intern(v)
+            self._cc_add(v)
+            self._version += 1
+            if self._log is not None:
+                self._log.record(('add_vertex', v))
+
+    @synchronized
     def add_edge(self, u: str, v: str) -> None:
         """
         Add edge to the graph
         """
+        self._check_writable()
         if u == v:
             return
-        elif u not in self.adj_list.keys() and v not in self.adj_list.keys():
-            self.adj_list[u] = [v]
-            self.adj_list[v] = [u]
-        elif u in self.adj_list.keys() and v not in self.adj_list.keys():
-            self.adj_list[u].append(v)
-            self.adj_list[v] = [u]
-        elif u not in self.adj_list.keys() and v in self.adj_list.keys():
-            self.adj_list[u] = [v]
-            self.adj_list[v].append(u)
-        else:
-            if u in self.adj_list[v] or v in self.adj_list[u]:
-                return
-            else:
-                self.adj_list[u].append(v)
-                self.adj_list[v].append(u)
+        i, j = self._ids.get(u), self._ids.get(v)
+        if i is not None and j is not None and j in self._adj[i]:
+            return
+        if i is None:
+            i = self._intern(u)
+        if j is None:
+            j = self._intern(v)
+        self._link(i, j)
+        self._link(j, i)
+        self._cc_union(u, v)
+        self._version += 1
+        if self._log is not None:
+            self._log.record(('add_edge', u, v))
 
+    @synchronized
     def remove_edge(self, v: str, u: str) -> None:
         """
         Remove edge from the graph
         """
-        if u not in self.adj_list.keys() or v not in self.adj_list.keys():
+        self._check_writable()
+        i, j = self._ids.get(v), self._ids.get(u)
+        if i is None or j is None:
             return
-        elif u not in self.adj_list[v] or v not in self.adj_list[u]:
+        elif j not in self._adj[i]:
             return
         else:
-            self.adj_list[v].remove(u)
-            self.adj_list[u].remove(v)
+            self._unlink(i, j)
+            self._unlink(j, i)
+            self._cc_split(v)
+            self._version += 1
+            if self._log is not None:
+                self._log.record(('remove_edge', v, u))
 
+    @synchronized
     def remove_vertex(self, v: str) -> None:
         """
         Remove vertex and all connected edges
         """
-        if v not in self.adj_list.keys():
+        self._check_writable()
+        i = self._ids.get(v)
+        if i is None:
             return
+        self._cc_discard(v)
         # Remove vertex from neighbors
-        for vertex in self.adj_list[v]:
-            self.adj_list[vertex].remove(v)
-        # Remove vertex from list
-        self.adj_list.pop(v)
+        for j in self._adj[i]:
+            self._unlink(j, i)
+        # Remove vertex from list, its id is free for reuse
+        del self._ids[v]
+        self._names[i] = None
+        self._adj[i] = None
+        if i < len(self._sorted):
+            self._sorted[i] = None
+        self._free.append(i)
+        self._version += 1
+        if self._log is not None:
+            self._log.record(('remove_vertex', v))
+
+    @synchronized
+    def apply_edits(self, edits) -> None:
+        """
+        Apply many mutations in one pass, with the same result as
+        calling them in order; each edit is a tuple of method name and
+        arguments: ('add_vertex', v), ('add_edge', u, v),
+        ('remove_edge', u, v) or ('remove_vertex', v)
+        """
+        self._check_writable()
+        if self._log is not None:
+            edits = list(edits)
+        ids, adj = self._ids, self._adj
+        # Existing vertices removed by the batch, and new vertices in
+        # order of creation (a removed vertex that comes back is both)
+        dropped = dict()
+        created = dict()
+        # Last state per edge (True if present) in order rows get it,
+        # edges are keyed by sorted vertex pair
+        pending = dict()
+        # Existing edges removed by the batch
+        reset = set()
+        # Pending edges of each vertex, dropped if the vertex is removed
+        touching = dict()
+
+        def exists(v):
+            return v in created or v in ids and v not in dropped
 
+        def present(key):
+            if key in pending:
+                return pending[key]
+            u, v = key
+            if u in dropped or v in dropped or u not in ids \
+                    or v not in ids:
+                return False
+            return ids[v] in adj[ids[u]]
+
+        for op, *args in edits:
+            if op == 'add_vertex':
+                v, = args
+                if not exists(v):
+                    created[v] = None
+            elif op == 'add_edge':
+                u, v = args
+                if u == v:
+                    continue
+                key = (u, v) if u < v else (v, u)
+                if present(key):
+                    continue
+                for w in (u, v):
+                    if not exists(w):
+                        created[w] = None
+                    touching.setdefault(w, []).append(key)
+                # Edge added again after removal moves to the end of rows
+                pending.pop(key, None)
+                pending[key] = True
+            elif op == 'remove_edge':
+                u, v = args
+                key = (u, v) if u < v else (v, u)
+                if not present(key):
+                    continue
+                if pending.get(key) is None:
+                    reset.add(key)
+                    for w in (u, v):
+                        touching.setdefault(w, []).append(key)
+                pending[key] = False
+            elif op == 'remove_vertex':
+                v, = args
+                if not exists(v):
+                    continue
+                for key in touching.pop(v, ()):
+                    pending.pop(key, None)
+                    reset.discard(key)
+                if v in created:
+                    del created[v]
+                if v in ids:
+                    dropped[v] = None
+            else:
+                raise ValueError(f'Unknown edit: {op!r}')
+        if not pending and not dropped and not created:
+            return
+
+        # Removed vertices leave the rows of their neighbors in one pass
+        gone = {ids[v] for v in dropped}
+        touched = set()
+        for i in gone:
+            touched.update(j for j in adj[i] if j not in gone)
+        for v in dropped:
+            i = ids.pop(v)
+            self._names[i] = None
+            adj[i] = None
+            if i < len(self._sorted):
+                self._sorted[i] = None
+            self._free.append(i)
+        self._filter_rows({j: gone for j in touched})
+
+        for v in created:
+            self._intern(v)
+
+        # Existing edges removed first, then new edges appended per row
+        drop_ids = dict()
+        for u, v in reset:
+            i, j = ids[u], ids[v]
+            drop_ids.setdefault(i, set()).add(j)
+            drop_ids.setdefault(j, set()).add(i)
+        self._filter_rows(drop_ids)
+        for (u, v), state in pending.items():
+            if state:
+                i, j = ids[u], ids[v]
+                self._link(i, j)
+                self._link(j, i)
+
+        # Components index is rebuilt once on the next query
+        self._cc_parent = None
+        self._version += 1
+        if self._log is not None:
+            for edit in edits:
+                self._log.record(edit)
+
+    @instrumented
     def get_vertices(self) -> list:
         """
         Return list of vertices in the graph (any order)
         """
-        vertices = []
-        for key in self.adj_list.keys():
-            vertices.append(key)
-        return vertices
+        return list(self._ids)
 
+    @instrumented
+    @cached
     def get_edges(self) -> list:
         """
         Return list of edges in the graph (any order)
         """
-        edges = []
-        edge_dict = self.adj_list.copy()
+        return list(self.iter_edges())
+
+    def iter_edges(self):
+        """
+        Yield edges of the graph in get_edges() order
+        """
+        names = self._names
+        done = set()
 
         # Visit every vertex
-        for key in edge_dict.keys():
-            # Ignore unconnected vertices
-            if edge_dict[key] != []:
-                # Build edge tuple, remove duplicates
-                for neighbor in edge_dict[key]:
-                    edges.append((key, neighbor))
-                    edge_dict[neighbor].remove(key)
-        
-        # Dereference copy
-        edge_dict = None
-
-        return edges
+        for key, i in self._ids.items():
+            # Edges to already visited vertices were added from their side
+            for j in self._adj[i]:
+                if j not in done:
+                    yield (key, names[j])
+            done.add(i)
 
+    @instrumented
     def is_valid_path(self, path: list) -> bool:
         """
         Return true if provided path is valid, False otherwise
@@ -135,131 +448,601 @@ class UndirectedGraph:
         # Travel entire path
         for i in range(len(path)):
             # Catch invalid vertices
-            if path[i] not in self.adj_list.keys():
+            if path[i] not in self._ids:
                 return False
             # Successful path
             elif i == (len(path) - 1):
                 return True
             # Next vertex is not adjacent
-            elif path[i + 1] not in self.adj_list[path[i]]:
+            elif self._ids.get(path[i + 1]) not in \
+                    self._adj[self._ids[path[i]]]:
                 return False
 
+    @instrumented
+    @cached
     def dfs(self, v_start, v_end=None) -> list:
         """
         Return list of vertices visited during DFS search
         Vertices are picked in alphabetical order
         """
-        if v_start not in self.adj_list.keys():
+        if v_start not in self._ids:
             return []
-        
-        if v_end not in self.adj_list.keys():
-            v_end = None
-
-        reachable = []
-        stack = [v_start]
-        
-        while stack != []:
-            v = stack.pop()
-            
-            if v == v_end:
-                reachable.append(v)
-                return reachable
-
-            # Travel to next vertex in alphabetical order
-            if v not in reachable:
-                reachable.append(v)
-                for neighbor in sorted(self.adj_list[v], reverse=True):
-                    stack.append(neighbor)
-        
-        return reachable
-                
+
+        # Search runs on vertex ids, order is translated back to names
+        order = dfs_order(self._ids[v_start], self._adjacent,
+                          self._ids.get(v_end), self.stats)
+        return [self._names[i] for i in order]
+
+    @instrumented
+    @cached
     def bfs(self, v_start, v_end=None) -> list:
         """
         Return list of vertices visited during BFS search
         Vertices are picked in alphabetical order
         """
-        if v_start not in self.adj_list.keys():
+        if v_start not in self._ids:
             return []
-        
-        if v_end not in self.adj_list.keys():
-            v_end = None
 
-        reachable = []
-        queue = [v_start]
-    
-        while queue != []:
-            v = queue.pop(0)
+        # Search runs on vertex ids, order is translated back to names
+        order = bfs_order(self._ids[v_start], self._adjacent,
+                          self._ids.get(v_end), self.stats)
+        return [self._names[i] for i in order]
 
-            if v == v_end:
-                reachable.append(v)
-                return reachable
+    @instrumented
+    @cached
+    def shortest_path(self, u: str, v: str) -> tuple:
+        """
+        Return tuple (hops, path) for path with fewest edges between two
+        vertices, found by BFS from both ends until the frontiers meet,
+        (float('inf'), []) if unreachable or vertex not in graph
+        """
+        if u not in self._ids or v not in self._ids:
+            return float('inf'), []
+        if u == v:
+            return 0, [u]
 
-            if v not in reachable:
-                reachable.append(v)
-                for neighbor in sorted(self.adj_list[v]):
-                    if neighbor not in reachable:
-                        queue.append(neighbor)
+        # Index 0 is the search from u, 1 the search from v
+        stats = self.stats
+        parents = ({self._ids[u]: None}, {self._ids[v]: None})
+        frontiers = [[self._ids[u]], [self._ids[v]]]
+        while frontiers[0] and frontiers[1]:
+            # Expand one full level of the smaller frontier, the first
+            # vertex seen by both searches lies on a shortest path
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            seen, other = parents[side], parents[1 - side]
+            level = []
+            for i in frontiers[side]:
+                if stats is not None:
+                    stats.count('shortest_path.vertices_popped')
+                for j in self._adj[i]:
+                    if j in seen:
+                        continue
+                    seen[j] = i
+                    if j in other:
+                        path = [self._names[k] for k in join_paths(parents, j)]
+                        return len(path) - 1, path
+                    level.append(j)
+            frontiers[side] = level
+        return float('inf'), []
 
-        return reachable
+    def iter_dfs(self, v_start, details=False):
+        """
+        Yield vertices in DFS order as they are visited,
+        (vertex, depth, parent) tuples if details is True
+        """
+        if v_start not in self._ids:
+            return iter(())
+        steps = iter_dfs(self._ids[v_start], self._adjacent, details,
+                         self.stats)
+        return self._named(steps, details)
 
+    def iter_bfs(self, v_start, details=False):
+        """
+        Yield vertices in BFS order as they are visited,
+        (vertex, depth, parent) tuples if details is True
+        """
+        if v_start not in self._ids:
+            return iter(())
+        steps = iter_bfs(self._ids[v_start], self._adjacent, details,
+                         self.stats)
+        return self._named(steps, details)
+
+    @instrumented
     def count_connected_components(self) -> int:
         """
         Return number of connected componets in the graph
         """
-        complete = sorted(self.adj_list.keys())
-        v = complete[0]
-        total_comps = []
-        quantity = 0
+        self._cc_refresh()
+        return self._cc_count
+
+    @instrumented
+    def same_component(self, u: str, v: str) -> bool:
+        """
+        Return True if both vertices are in the same connected component
+        """
+        if u not in self._ids or v not in self._ids:
+            return False
+        self._cc_refresh()
+        return self._cc_find(u) == self._cc_find(v)
+
+    @instrumented
+    @cached
+    def has_cycle(self) -> bool:
+        """
+        Return True if graph contains a cycle, False otherwise
+        """
+        return self.find_cycle() != []
+
+    @instrumented
+    @cached
+    def find_cycle(self) -> list:
+        """
+        Return list of vertices forming a cycle in traversal order
+        (last vertex is adjacent to first), empty list if acyclic
+        """
+        return drain(self._find_cycle_steps())
+
+    # Async variants run on snapshot() so writers are never blocked,
+    # and hand control back to the event loop every yield_every rows
+    # copied or vertex expansions; timeout raises asyncio.TimeoutError
+    # (see graph_async)
+
+    async def dfs_async(self, v_start, v_end=None, yield_every=YIELD_EVERY,
+                        timeout=None) -> list:
+        """
+        Awaitable dfs()
+        """
+        steps = on_snapshot(self, lambda view: collect(
+            view.iter_dfs(v_start), v_end))
+        return await run_steps(steps, yield_every, timeout)
 
-        while total_comps != complete:
-            quantity += 1
-            total_comps.extend(self.bfs(v))
+    async def bfs_async(self, v_start, v_end=None, yield_every=YIELD_EVERY,
+                        timeout=None) -> list:
+        """
+        Awaitable bfs()
+        """
+        steps = on_snapshot(self, lambda view: collect(
+            view.iter_bfs(v_start), v_end))
+        return await run_steps(steps, yield_every, timeout)
 
-            # Complete list of vertices are already sorted
-            if sorted(total_comps) == complete:
-                return quantity
+    async def count_connected_components_async(self, yield_every=YIELD_EVERY,
+                                               timeout=None) -> int:
+        """
+        Awaitable count_connected_components()
+        """
+        # Up-to-date index of this graph answers without a search
+        with self._lock:
+            if self._cc_parent is not None and not self._cc_dirty:
+                return self._cc_count
+        def count(view):
+            if view._cc_parent is None:
+                yield from view._cc_build_steps()
+            return view._cc_count
 
-            # Cast to sets and find disconnected component
+        return await run_steps(on_snapshot(self, count), yield_every,
+                               timeout)
+
+    async def has_cycle_async(self, yield_every=YIELD_EVERY,
+                              timeout=None) -> bool:
+        """
+        Awaitable has_cycle()
+        """
+        return await self.find_cycle_async(yield_every, timeout) != []
+
+    async def find_cycle_async(self, yield_every=YIELD_EVERY,
+                               timeout=None) -> list:
+        """
+        Awaitable find_cycle()
+        """
+        steps = on_snapshot(self, lambda view: view._find_cycle_steps())
+        return await run_steps(steps, yield_every, timeout)
+
+    def enable_concurrency(self) -> None:
+        """
+        Make mutations take a lock from now on, so the graph can be
+        changed from several threads; off by default since the lock
+        slows down every mutation
+        """
+        if self._lock is NO_LOCK:
+            self._lock = make_lock(True)
+
+    def disable_concurrency(self) -> None:
+        """
+        Make mutations stop taking the lock, only call this while no
+        other thread uses the graph
+        """
+        self._lock = NO_LOCK
+
+    def enable_stats(self, callback=None) -> GraphStats:
+        """
+        Turn on instrumentation and return the GraphStats collecting it,
+        callback(method, seconds) is called after every public method call
+        """
+        self.stats = GraphStats(callback)
+        return self.stats
+
+    def disable_stats(self) -> dict:
+        """
+        Turn off instrumentation, return what was collected as dict
+        """
+        stats, self.stats = self.stats, None
+        return stats.as_dict() if stats is not None else {}
+
+    # Connected components index
+    # - union-find forest over vertex names, members kept per root
+    # - edge/vertex additions union in O(a(n)) amortized
+    # - removals only mark the component dirty, it is relabeled by
+    #   BFS on the next query; removed vertices stay in the forest as
+    #   ghosts until then so paths through them still resolve
+
+    def _cc_build(self) -> None:
+        """
+        Build components index from scratch
+        """
+        drain(self._cc_build_steps())
+
+    def _cc_build_steps(self):
+        """
+        Step generator building components index, yields once per
+        labeled vertex; index is published at the end, parent map last,
+        so concurrent readers of a snapshot never see a partial index
+        """
+        parent = dict()
+        members = dict()
+        for v_start in self._ids:
+            if v_start in parent:
+                continue
+            component = set()
+            for v in iter_bfs(v_start, self._neighbors):
+                component.add(v)
+                parent[v] = v_start
+                yield
+            members[v_start] = component
+        with self._lock:
+            if self._cc_parent is not None:
+                return
+            self._cc_members = members
+            self._cc_dirty = set()
+            self._cc_ghosts = set()
+            self._cc_count = len(members)
+            self._cc_parent = parent
+
+    def _cc_label(self, v_start: str, parent: dict) -> None:
+        """
+        Label component reachable from vertex with new root
+        """
+        members = set(iter_bfs(v_start, self._neighbors))
+        for v in members:
+            parent[v] = v_start
+        self._cc_members[v_start] = members
+        self._cc_count += 1
+
+    def _cc_refresh(self) -> None:
+        """
+        Build index if missing, relabel components dirtied by removals
+        """
+        if self._cc_parent is not None and not self._cc_dirty:
+            return
+        with self._lock:
+            if self._cc_parent is None:
+                self._cc_build()
+                return
+            dirty, self._cc_dirty = self._cc_dirty, set()
+            for root in dirty:
+                members = self._cc_members.pop(root)
+                self._cc_count -= 1
+                for v in members:
+                    del self._cc_parent[v]
+                for v in members:
+                    if v not in self._cc_parent:
+                        self._cc_label(v, self._cc_parent)
+            for v in self._cc_ghosts:
+                self._cc_parent.pop(v, None)
+            self._cc_ghosts.clear()
+
+    def _cc_find(self, v: str) -> str:
+        """
+        Return root of vertex, halving paths along the way
+        """
+        parent = self._cc_parent
+        while parent[v] != v:
+            parent[v] = parent[parent[v]]
+            v = parent[v]
+        return v
+
+    def _cc_add(self, v: str) -> None:
+        """
+        Add vertex to index as its own component
+        """
+        if self._cc_parent is None:
+            return
+        # Reused name of removed vertex must not extend old paths
+        if v in self._cc_ghosts:
+            self._cc_refresh()
+        if v in self._cc_parent:
+            return
+        self._cc_parent[v] = v
+        self._cc_members[v] = {v}
+        self._cc_count += 1
+
+    def _cc_union(self, u: str, v: str) -> None:
+        """
+        Merge components of two vertices, smaller into larger
+        """
+        if self._cc_parent is None:
+            return
+        self._cc_add(u)
+        self._cc_add(v)
+        u_root, v_root = self._cc_find(u), self._cc_find(v)
+        if u_root == v_root:
+            return
+        if len(self._cc_members[u_root]) < len(self._cc_members[v_root]):
+            u_root, v_root = v_root, u_root
+        self._cc_parent[v_root] = u_root
+        self._cc_members[u_root] |= self._cc_members.pop(v_root)
+        self._cc_count -= 1
+        # Merged component must still be relabeled if either part was dirty
+        if v_root in self._cc_dirty:
+            self._cc_dirty.discard(v_root)
+            self._cc_dirty.add(u_root)
+
+    def _cc_split(self, v: str) -> None:
+        """
+        Mark component of vertex as possibly split
+        """
+        if self._cc_parent is None:
+            return
+        self._cc_dirty.add(self._cc_find(v))
+
+    def _cc_discard(self, v: str) -> None:
+        """
+        Drop vertex from its component, which may split
+        """
+        if self._cc_parent is None:
+            return
+        root = self._cc_find(v)
+        self._cc_members[root].discard(v)
+        self._cc_ghosts.add(v)
+        self._cc_dirty.add(root)
+
+    def _check_writable(self) -> None:
+        """
+        Raise TypeError for graphs wrapping read-only CSR arrays
+        """
+        if isinstance(self._adj, CSRRows):
+            raise TypeError('CSR graph is read-only')
+
+    def _intern(self, v: str) -> int:
+        """
+        Return id of vertex, adding vertex without edges if new
+        """
+        i = self._ids.get(v)
+        if i is not None:
+            return i
+        if self._free:
+            i = self._free.pop()
+            self._names[i] = v
+            self._adj[i] = array('i')
+        else:
+            i = len(self._names)
+            self._names.append(v)
+            self._adj.append(array('i'))
+        self._ids[v] = i
+        return i
+
+    def _link(self, i: int, j: int) -> None:
+        """
+        Append id j to neighbor row of id i
+        """
+        if i < len(self._sorted):
+            self._sorted[i] = None
+        row = self._adj[i]
+        if type(row) is dict:
+            row[j] = None
+        elif len(row) < HUB_DEGREE:
+            row.append(j)
+        else:
+            # Dicts keep insertion order, so neighbor order is preserved
+            row = self._adj[i] = dict.fromkeys(row)
+            row[j] = None
+
+    def _unlink(self, i: int, j: int) -> None:
+        """
+        Remove id j from neighbor row of id i
+        """
+        if i < len(self._sorted):
+            self._sorted[i] = None
+        row = self._adj[i]
+        if type(row) is dict:
+            del row[j]
+        else:
+            row.remove(j)
+
+    def _filter_rows(self, removals: dict) -> None:
+        """
+        Remove set of ids from neighbor row of each id in removals,
+        rebuilding every row once
+        """
+        for i, gone in removals.items():
+            if i < len(self._sorted):
+                self._sorted[i] = None
+            row = self._adj[i]
+            if type(row) is dict:
+                for j in gone:
+                    row.pop(j, None)
             else:
-                v = list(set(complete).difference(set(total_comps)))[0]
+                self._adj[i] = array('i', [j for j in row if j not in gone])
 
-    def has_cycle(self) -> bool:
+    def _neighbors(self, v: str) -> list:
         """
-        Return True if graph contains a cycle, False otherwise
+        Return neighbor names of vertex in insertion order
+        """
+        names = self._names
+        return [names[j] for j in self._adj[self._ids[v]]]
+
+    def _adjacent(self, i: int):
+        """
+        Return neighbor ids of vertex id in alphabetical order of names,
+        each row is sorted once and kept until it changes
+        """
+        cache = self._sorted
+        if i < len(cache) and cache[i] is not None:
+            return cache[i]
+        version = self._version
+        row = self._adj[i]
+        if len(row) < 2:
+            return row
+        row = array('i', sorted(row, key=self._names.__getitem__))
+        # Row read during a concurrent mutation may already be stale
+        if self._version == version:
+            if i >= len(cache):
+                cache.extend([None] * (len(self._adj) - len(cache)))
+            cache[i] = row
+        return row
+
+    def _named(self, steps, details: bool):
+        """
+        Yield steps of a traversal over ids with ids replaced by names
+        """
+        names = self._names
+        if not details:
+            for i in steps:
+                yield names[i]
+            return
+        for i, depth, parent in steps:
+            yield names[i], depth, None if parent is None else names[parent]
+
+    def _find_cycle_steps(self):
         """
+        Step generator behind find_cycle(), yields once per popped vertex
+        """
+        # Search runs on vertex ids, cycle is translated back to names
+        parent = dict()
+        stats = self.stats
+
         # Check multiple connected components
-        for i in list(self.adj_list.keys()):
-            # Initialize visited list with root
-            visited = [i]
-            # Initialize stack with 2nd-degree neighbors
-            for adjacent in self.adj_list[i]:
-                stack = []
-                for neighbor in self.adj_list[adjacent]:
-                    if neighbor != i:
+        for root in self._ids.values():
+            if root in parent:
+                continue
+            parent[root] = None
+            stack = [root]
+            while stack:
+                if stats is not None:
+                    stats.count('find_cycle.vertices_popped')
+                    stats.mark('find_cycle.stack', len(stack))
+                v = stack.pop()
+                yield
+                for neighbor in self._adj[v]:
+                    if neighbor not in parent:
+                        parent[neighbor] = v
                         stack.append(neighbor)
-                result = self.has_cycle_helper(adjacent, visited, stack)
-                if result is True:
-                    return True
-        return False
-
-    def has_cycle_helper(self, vertex, visited: list, stack: list) -> bool:
-        while stack != []:
-            v = stack.pop()
-            # Check 2nd-degree neighbors for any backedge
-            if not set(self.adj_list[v]).isdisjoint(set(visited)):
-                return True
-            # Pass down new lists to next recursive level
+                    # Any discovered vertex other than the tree parent
+                    # is reachable by a second path
+                    elif neighbor != parent[v] and parent[neighbor] != v:
+                        cycle = self._tree_cycle(parent, v, neighbor)
+                        return [self._names[i] for i in cycle]
+        return []
+
+    def _tree_cycle(self, parent: dict, u: str, v: str) -> list:
+        """
+        Return cycle closed by non-tree edge u-v using tree parents
+        """
+        u_path = [u]
+        while parent[u_path[-1]] is not None:
+            u_path.append(parent[u_path[-1]])
+        ancestors = set(u_path)
+
+        # Climb from v until paths meet at common ancestor
+        v_path = [v]
+        while v_path[-1] not in ancestors:
+            v_path.append(parent[v_path[-1]])
+        meet = u_path.index(v_path[-1])
+        return u_path[:meet + 1][::-1] + v_path[:-1]
+
+
+class AdjacencyView(Mapping):
+    """
+    Read-only {name: [neighbor names]} mapping over UndirectedGraph,
+    neighbor lists are built on lookup
+    """
+
+    __slots__ = ('_graph',)
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __getitem__(self, v) -> list:
+        if v not in self._graph._ids:
+            raise KeyError(v)
+        return self._graph._neighbors(v)
+
+    def __contains__(self, v) -> bool:
+        return v in self._graph._ids
+
+    def __iter__(self):
+        return iter(self._graph._ids)
+
+    def __len__(self) -> int:
+        return len(self._graph._ids)
+
+
+class SortedIndex(Mapping):
+    """
+    Read-only {name: id} mapping over sequence of sorted names,
+    names are found by binary search
+    """
+
+    __slots__ = ('names',)
+
+    def __init__(self, names):
+        self.names = names
+
+    def __getitem__(self, name) -> int:
+        names = self.names
+        lo, hi = 0, len(names)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if names[mid] < name:
+                lo = mid + 1
             else:
-                new_visited = visited.copy()
-                new_visited.append(vertex)
-                new_stack = []
-                for adjacent in self.adj_list[v]:
-                    if adjacent != vertex:
-                        new_stack.append(adjacent)
-                result = self.has_cycle_helper(v, new_visited, new_stack)
-                if result is True:
-                    return True
-        return False
+                hi = mid
+        if lo < len(names) and names[lo] == name:
+            return lo
+        raise KeyError(name)
+
+    def __contains__(self, name) -> bool:
+        try:
+            self[name]
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+class CSRRows(Sequence):
+    """
+    Read-only sequence of neighbor id tuples over CSR arrays
+    """
+
+    __slots__ = ('offsets', 'targets')
+
+    def __init__(self, offsets, targets):
+        self.offsets = offsets
+        self.targets = targets
+
+    def __getitem__(self, i) -> tuple:
+        return tuple(self.targets[self.offsets[i]:self.offsets[i + 1]])
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
 
 
 if __name__ == '__main__':